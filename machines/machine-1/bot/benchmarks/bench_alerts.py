@@ -0,0 +1,112 @@
+"""Alert latency from the generator UPDATE commit to each sendMessage returning.
+
+Needs the database from DB_* and starts stub_bot_api.py itself. Subscriptions for
+BENCH_SUBSCRIBERS fake chats are created and removed again.
+"""
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+sys.path[:0] = [
+    os.path.join(os.path.dirname(__file__), ".."),
+    os.path.join(os.path.dirname(__file__), "..", "bot"),
+]
+
+from aiogram import Bot
+from aiogram.client.telegram import TelegramAPIServer
+
+from sqlalchemy import select, update, delete
+from db.database import create_db_engine, create_session_maker
+from db.models import Base, GeneratorData, AlertSubscription, AlertState
+from db.notify import NotificationListener, GENERATOR_CHANNEL, install_notify_triggers
+
+from alerts import AlertEngine, TEMPERATURE, LEVEL_WARNING
+from cache import GeneratorSnapshotCache
+from outbound import OutboundRateLimiter
+from transport import TunedAiohttpSession
+
+SUBSCRIBERS = int(os.getenv("BENCH_SUBSCRIBERS", "300"))
+GLOBAL_RATE = float(os.getenv("BENCH_GLOBAL_RATE", "30"))
+PORT = int(os.getenv("BENCH_STUB_PORT", "18082"))
+CHAT_ID_BASE = 10 ** 12
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+async def main():
+    engine = create_db_engine()
+    session_maker = create_session_maker(engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await install_notify_triggers(conn)
+
+    chat_ids = [CHAT_ID_BASE + i for i in range(SUBSCRIBERS)]
+    async with session_maker() as session:
+        original = (await session.execute(select(GeneratorData).limit(1))).scalar_one()
+        original_temperature = original.temperature
+        session.add_all(AlertSubscription(chat_id=chat_id, min_level=LEVEL_WARNING) for chat_id in chat_ids)
+        await session.execute(update(AlertState).where(AlertState.metric == TEMPERATURE.metric).values(level=0))
+        await session.commit()
+
+    sent_at = []
+
+    async def record_send(make_request, bot, method):
+        result = await make_request(bot, method)
+        if method.__api_method__ == "sendMessage" and method.chat_id >= CHAT_ID_BASE:
+            sent_at.append(time.perf_counter())
+        return result
+
+    session = TunedAiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{PORT}"))
+    session.middleware(OutboundRateLimiter(global_rate=GLOBAL_RATE))
+    session.middleware(record_send)
+    bot = Bot("42:BENCH", session=session)
+
+    listener = NotificationListener()
+    cache = GeneratorSnapshotCache(session_maker, listener)
+    alert_engine = AlertEngine(session_maker, cache.get, senders=16)
+    listener.add_listener(GENERATOR_CHANNEL, cache.invalidate)
+    listener.add_listener(GENERATOR_CHANNEL, alert_engine.notify)
+    await listener.start()
+    await alert_engine.start(bot)
+    while not listener.connected:
+        await asyncio.sleep(0.05)
+    await asyncio.sleep(0.2)
+
+    try:
+        async with session_maker() as db_session:
+            await db_session.execute(update(GeneratorData).where(GeneratorData.id == original.id).values(temperature=TEMPERATURE.critical + 10))
+            await db_session.commit()
+        committed_at = time.perf_counter()
+        while len(sent_at) < SUBSCRIBERS:
+            await asyncio.sleep(0.01)
+        latencies = [at - committed_at for at in sent_at]
+        print(f"{SUBSCRIBERS} subscribers, global rate {GLOBAL_RATE}/s")
+        print(f"first alert  {min(latencies) * 1000:9.1f}ms after commit")
+        print(f"p50          {percentile(latencies, 0.5) * 1000:9.1f}ms")
+        print(f"p99          {percentile(latencies, 0.99) * 1000:9.1f}ms")
+        print(f"last alert   {max(latencies) * 1000:9.1f}ms ({SUBSCRIBERS / max(latencies):.1f} alerts/s)")
+    finally:
+        await alert_engine.stop()
+        await listener.stop()
+        async with session_maker() as db_session:
+            await db_session.execute(update(GeneratorData).where(GeneratorData.id == original.id).values(temperature=original_temperature))
+            await db_session.execute(delete(AlertSubscription).where(AlertSubscription.chat_id >= CHAT_ID_BASE))
+            await db_session.execute(update(AlertState).where(AlertState.metric == TEMPERATURE.metric).values(level=0))
+            await db_session.commit()
+        await bot.session.close()
+        await engine.dispose()
+
+if __name__ == "__main__":
+    stub = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(__file__), "stub_bot_api.py"), "--port", str(PORT)],
+        stdout=subprocess.PIPE, text=True,
+    )
+    try:
+        stub.stdout.readline()
+        asyncio.run(main())
+    finally:
+        stub.terminate()
+        stub.wait()
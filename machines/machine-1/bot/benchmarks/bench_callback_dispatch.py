@@ -0,0 +1,84 @@
+"""Dispatch overhead per callback query with 10 and 500 exact-match handlers.
+
+linear:  @router.callback_query(F.data == "...") handlers, scanned in order
+indexed: IndexedRouter with callback_query.data("..."), one dict lookup
+
+Each run feeds the update for the first and for the last registered handler
+through Dispatcher.feed_update; the handlers do nothing, so the time is routing only.
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path[:0] = [
+    os.path.join(os.path.dirname(__file__), ".."),
+    os.path.join(os.path.dirname(__file__), "..", "bot"),
+]
+
+from aiogram import Bot, Dispatcher, F, Router
+from aiogram.types import CallbackQuery, Update
+
+from callbacks import ChartCallback, IndexedRouter
+
+COUNTS = [int(count) for count in os.getenv("BENCH_HANDLERS", "10,500").split(",")]
+ITERATIONS = int(os.getenv("BENCH_ITERATIONS", "5000"))
+
+async def noop(callback: CallbackQuery) -> None:
+    pass
+
+def linear_dispatcher(count: int) -> Dispatcher:
+    router = Router()
+    for index in range(count):
+        router.callback_query(F.data == f"button_{index}")(noop)
+    router.callback_query(ChartCallback.filter())(noop)
+    dispatcher = Dispatcher()
+    dispatcher.include_router(router)
+    return dispatcher
+
+def indexed_dispatcher(count: int) -> Dispatcher:
+    router = IndexedRouter()
+    for index in range(count):
+        router.callback_query.data(f"button_{index}")(noop)
+    router.callback_query.data(ChartCallback)(noop)
+    dispatcher = Dispatcher()
+    dispatcher.include_router(router)
+    return dispatcher
+
+def callback_update(data: str, telegram_bot: Bot) -> Update:
+    return Update.model_validate({
+        "update_id": 1,
+        "callback_query": {
+            "id": "1", "chat_instance": "bench", "data": data,
+            "from": {"id": 1, "is_bot": False, "first_name": "bench"},
+            "message": {"message_id": 5, "date": 0, "text": "x", "chat": {"id": 1, "type": "private"}},
+        },
+    }, context={"bot": telegram_bot})
+
+async def measure(dispatcher: Dispatcher, telegram_bot: Bot, update: Update) -> float:
+    for _ in range(100):
+        await dispatcher.feed_update(telegram_bot, update)
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        await dispatcher.feed_update(telegram_bot, update)
+    return (time.perf_counter() - start) / ITERATIONS * 1e6
+
+async def main():
+    telegram_bot = Bot("42:BENCH")
+    print(f"{ITERATIONS} updates per cell, microseconds per feed_update")
+    print(f"{'handlers':>8} {'target':<8} {'linear':>9} {'indexed':>9}")
+    for count in COUNTS:
+        dispatchers = (linear_dispatcher(count), indexed_dispatcher(count))
+        targets = {
+            "first": "button_0",
+            "last": f"button_{count - 1}",
+            "factory": ChartCallback(metric="power", hours=24).pack(),
+        }
+        for target, data in targets.items():
+            update = callback_update(data, telegram_bot)
+            linear, indexed = [await measure(dispatcher, telegram_bot, update) for dispatcher in dispatchers]
+            print(f"{count:>8} {target:<8} {linear:9.1f} {indexed:9.1f}")
+    await telegram_bot.session.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,50 @@
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path[:0] = [
+    os.path.join(os.path.dirname(__file__), ".."),
+    os.path.join(os.path.dirname(__file__), "..", "bot"),
+]
+
+from scheduler import ChatLaneScheduler
+
+UPDATES = int(os.getenv("BENCH_UPDATES", "4000"))
+CHATS = int(os.getenv("BENCH_CHATS", "200"))
+# stands in for the DB read and the edit_text round-trip of a handler
+HANDLER_IO_SECONDS = float(os.getenv("BENCH_HANDLER_IO", "0.005"))
+LANE_COUNTS = [1, 2, 4, 8, 16, 32, 64]
+
+async def run(lanes: int) -> float:
+    last_seen = {}
+    reordered = 0
+
+    async def feed(chat_id, sequence):
+        nonlocal reordered
+        await asyncio.sleep(HANDLER_IO_SECONDS)
+        if last_seen.get(chat_id, -1) > sequence:
+            reordered += 1
+        last_seen[chat_id] = sequence
+
+    scheduler = ChatLaneScheduler(feed, lanes=lanes, capacity=UPDATES)
+    rng = random.Random(0)
+    start = time.perf_counter()
+    await scheduler.start()
+    for sequence in range(UPDATES):
+        chat_id = rng.randrange(CHATS)
+        scheduler.submit(chat_id, chat_id, sequence)
+    await scheduler.join()
+    elapsed = time.perf_counter() - start
+    await scheduler.stop()
+    assert reordered == 0, "per-chat order violated"
+    return UPDATES / elapsed
+
+async def main():
+    print(f"{UPDATES} updates over {CHATS} chats, {HANDLER_IO_SECONDS * 1000:.1f}ms handler I/O")
+    for lanes in LANE_COUNTS:
+        print(f"lanes={lanes:<3} {await run(lanes):10.1f} updates/s")
+
+if __name__ == "__main__":
+    asyncio.run(main())
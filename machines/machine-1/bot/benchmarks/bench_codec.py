@@ -0,0 +1,82 @@
+"""JSON cost per webhook update: parse the body, log it, serialize the reply, for each codec.
+
+baseline: what the bot did before, request.json() (decode, then json.loads) and aiogram's
+          default json.dumps for the request form
+json/orjson: codec.CODECS, loads straight from the body bytes
+
+Update validation into the pydantic model is shown once; it does not depend on the codec.
+"""
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path[:0] = [
+    os.path.join(os.path.dirname(__file__), ".."),
+    os.path.join(os.path.dirname(__file__), "..", "bot"),
+]
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.methods import SendMessage
+from aiogram.types import InlineKeyboardMarkup, Update
+
+from codec import CODECS
+
+ITERATIONS = int(os.getenv("BENCH_ITERATIONS", "20000"))
+
+UPDATE = {
+    "update_id": 123456789,
+    "callback_query": {
+        "id": "4382bfdwdsb323b2d9", "chat_instance": "-8264733285611111111", "data": "status",
+        "from": {"id": 111111111, "is_bot": False, "first_name": "Оператор", "username": "operator", "language_code": "ru"},
+        "message": {
+            "message_id": 5120, "date": 1735732800, "edit_date": 1735732860,
+            "chat": {"id": 111111111, "type": "private", "first_name": "Оператор", "username": "operator"},
+            "from": {"id": 42, "is_bot": True, "first_name": "Генератор №1", "username": "generator_bot"},
+            "text": "📊 СТАТУС СИСТЕМЫ\n\n⚡ Генератор: АКТИВЕН\n🔌 Мощность: 2500.0 МВт\n🌡️ Температура: 85.3°C",
+            "entities": [{"type": "bold", "offset": 3, "length": 14}, {"type": "bold", "offset": 33, "length": 7}],
+            "reply_markup": {"inline_keyboard": [
+                [{"text": "📊 Статус системы", "callback_data": "status"}],
+                [{"text": "⚡ Параметры генератора", "callback_data": "generator"}],
+                [{"text": "🔧 Диагностика", "callback_data": "diagnostics"}],
+                [{"text": "📈 Мониторинг", "callback_data": "monitoring"}],
+                [{"text": "⚙️ Настройки", "callback_data": "settings"}],
+            ]},
+        },
+    },
+}
+BODY = json.dumps(UPDATE).encode()
+KEYBOARD = InlineKeyboardMarkup.model_validate(UPDATE["callback_query"]["message"]["reply_markup"])
+REPLY = SendMessage(chat_id=111111111, text=UPDATE["callback_query"]["message"]["text"] * 4, reply_markup=KEYBOARD)
+LOG_RECORD = {
+    "ts": datetime.now(timezone.utc), "method": "POST", "path": "/webhook", "remote": "127.0.0.1",
+    "headers": {"Content-Type": "application/json", "Content-Length": str(len(BODY))},
+    "body": BODY.decode(), "status": 200, "duration_ms": 0.412,
+}
+
+def measure(step) -> float:
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        step()
+    return (time.perf_counter() - start) / ITERATIONS * 1e6
+
+def main():
+    telegram_bot = Bot("42:BENCH")
+    variants = {"baseline": (lambda body: json.loads(body.decode()), AiohttpSession(), lambda record: json.dumps(record, ensure_ascii=False, default=str))}
+    for name, codec in CODECS.items():
+        variants[name] = (codec.loads, AiohttpSession(json_loads=codec.loads, json_dumps=codec.dumps), lambda record, dumps=codec.dumps: dumps(record, default=str))
+
+    validate = measure(lambda: Update.model_validate(UPDATE, context={"bot": telegram_bot}))
+    print(f"{ITERATIONS} runs each, microseconds; body {len(BODY)} bytes; Update.model_validate {validate:.1f}")
+    print(f"{'codec':<9} {'parse':>7} {'log':>7} {'reply':>7} {'total':>7}")
+    for name, (loads, session, log_dumps) in variants.items():
+        assert loads(BODY) == UPDATE
+        parse = measure(lambda: loads(BODY))
+        log = measure(lambda: log_dumps(LOG_RECORD))
+        reply = measure(lambda: session.build_form_data(telegram_bot, REPLY))
+        print(f"{name:<9} {parse:7.1f} {log:7.1f} {reply:7.1f} {parse + log + reply:7.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path[:0] = [
+    os.path.join(os.path.dirname(__file__), ".."),
+    os.path.join(os.path.dirname(__file__), "..", "bot"),
+]
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import Update
+from sqlalchemy import select
+
+import bot
+from db.models import Base, User
+
+ITERATIONS = int(os.getenv("BENCH_ITERATIONS", "2000"))
+ID_BASE = 9_000_000_000
+
+async def legacy_get_or_create_user(telegram_id: int, username: str = None) -> User:
+    async with bot.async_session_maker() as session:
+        result = await session.execute(select(User).where(User.telegram_id == telegram_id))
+        user = result.scalar_one_or_none()
+        if not user:
+            user = User(telegram_id=telegram_id, username=username, is_admin=(telegram_id == bot.ADMIN_ID))
+            session.add(user)
+            await session.commit()
+            await session.refresh(user)
+        return user
+
+async def upsert_get_or_create_user(telegram_id: int, username: str = None) -> User:
+    async with bot.async_session_maker() as session:
+        result = await session.execute(bot.user_upsert_statement(telegram_id, username))
+        user = result.scalar_one()
+        await session.commit()
+        return user
+
+async def current_get_or_create_user(telegram_id: int, username: str = None) -> bot.CachedUser:
+    async with bot.async_session_maker() as session:
+        user = await bot.load_or_create_user(session, telegram_id, username)
+        await session.commit()
+        return user
+
+async def measure(name, func, id_offset):
+    for phase in ("new", "existing"):
+        timings = []
+        for i in range(ITERATIONS):
+            telegram_id = ID_BASE + id_offset + i
+            start = time.perf_counter()
+            await func(telegram_id, "bench")
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        print(
+            f"{name:<8} {phase:<9} mean={statistics.fmean(timings):.3f}ms "
+            f"p50={timings[len(timings) // 2]:.3f}ms "
+            f"p99={timings[int(len(timings) * 0.99)]:.3f}ms"
+        )
+
+class CapturedRequests(BaseRequestMiddleware):
+    """Records Bot API calls instead of sending them."""
+
+    def __init__(self):
+        self.methods = []
+
+    async def __call__(self, make_request, bot, method):
+        self.methods.append(method)
+        return True
+
+async def check_callback_settings(telegram_id: int):
+    """callback_settings has to render for a user loaded from the database and for a cached one."""
+    telegram_bot = Bot("42:BENCH")
+    captured = CapturedRequests()
+    telegram_bot.session.middleware(captured)
+    callback = Update.model_validate({
+        "update_id": 1,
+        "callback_query": {
+            "id": "1", "chat_instance": "bench", "data": "settings",
+            "from": {"id": telegram_id, "is_bot": False, "first_name": "bench"},
+            "message": {"message_id": 5, "date": 0, "text": "x", "chat": {"id": telegram_id, "type": "private"}},
+        },
+    }, context={"bot": telegram_bot}).callback_query
+    bot.user_cache.invalidate(telegram_id)
+    for lookup in ("miss", "hit"):
+        hits = bot.user_cache.hits
+        async with bot.async_session_maker() as session:
+            await bot.callback_settings(callback, session)
+            await session.commit()
+        assert (bot.user_cache.hits > hits) == (lookup == "hit"), lookup
+        edit = next(method for method in reversed(captured.methods) if method.__api_method__ == "editMessageText")
+        assert "Зарегистрирован: " in edit.text, lookup
+    await telegram_bot.session.close()
+    print("callback_settings renders on a cache miss and a cache hit")
+
+async def main():
+    async with bot.engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    try:
+        await measure("legacy", legacy_get_or_create_user, 0)
+        await measure("upsert", upsert_get_or_create_user, ITERATIONS)
+        await measure("current", current_get_or_create_user, 2 * ITERATIONS)
+        await check_callback_settings(ID_BASE + 3 * ITERATIONS)
+    finally:
+        async with bot.engine.begin() as conn:
+            await conn.execute(User.__table__.delete().where(User.telegram_id >= ID_BASE))
+        await bot.engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
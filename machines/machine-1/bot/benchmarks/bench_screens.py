@@ -0,0 +1,131 @@
+"""CPU per callback for the status and generator screens, up to the request that would go out.
+
+legacy:  keyboard models and text built on every tap, then the editMessageText form
+cached:  the screen taken from the snapshot cache or prebuilt, then the same form
+skipped: the message already shows the screen, so no request is prepared at all
+
+No request is sent; process time only covers building and serializing it.
+"""
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path[:0] = [
+    os.path.join(os.path.dirname(__file__), ".."),
+    os.path.join(os.path.dirname(__file__), "..", "bot"),
+]
+
+from aiogram.methods import EditMessageText
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, Update
+
+import bot
+from db.models import GeneratorData
+
+ITERATIONS = int(os.getenv("BENCH_ITERATIONS", "20000"))
+
+def legacy_main_keyboard():
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="📊 Статус системы", callback_data="status")],
+        [InlineKeyboardButton(text="⚡ Параметры генератора", callback_data="generator")],
+        [InlineKeyboardButton(text="🔧 Диагностика", callback_data="diagnostics")],
+        [InlineKeyboardButton(text="📈 Мониторинг", callback_data="monitoring")],
+        [InlineKeyboardButton(text="⚙️ Настройки", callback_data="settings")],
+        [InlineKeyboardButton(text="Веб-интерфейс", url=bot.DOCS_PUBLIC_URL)]
+    ])
+
+def legacy_generator_keyboard():
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🔋 Мощность", callback_data="gen_power")],
+        [InlineKeyboardButton(text="🌡️ Температура", callback_data="gen_temp")],
+        [InlineKeyboardButton(text="💨 Охлаждение", callback_data="gen_cooling")],
+        [InlineKeyboardButton(text="⚙️ Турбина", callback_data="gen_turbine")],
+        [InlineKeyboardButton(text="🔙 Назад", callback_data="back_main")]
+    ])
+
+def legacy_status(gen_data):
+    return f"""
+📊 <b>СТАТУС СИСТЕМЫ</b>
+
+⚡ Генератор: <b>АКТИВЕН</b>
+🔌 Мощность: <b>{gen_data.power_output:.1f} МВт</b>
+🌡️ Температура: <b>{gen_data.temperature:.1f}°C</b>
+💨 Давление: <b>{gen_data.pressure:.1f} кПа</b>
+📊 Эффективность: <b>{gen_data.efficiency:.1f}%</b>
+
+🔋 Топливо: <b>{gen_data.fuel_level:.1f}%</b>
+💧 Охлаждение: <b>{gen_data.coolant_flow:.1f} л/мин</b>
+⚙️ Турбина: <b>{gen_data.turbine_rpm:.0f} об/мин</b>
+
+⏱️ Обновлено: {gen_data.updated_at.strftime('%Y-%m-%d %H:%M:%S')}
+    """, legacy_main_keyboard()
+
+def legacy_generator(gen_data):
+    return """
+⚡ <b>ПАРАМЕТРЫ ГЕНЕРАТОРА</b>
+
+Выберите параметр для просмотра детальной информации:
+    """, legacy_generator_keyboard()
+
+def callback_message(text, markup, telegram_bot):
+    update = Update.model_validate({
+        "update_id": 1,
+        "callback_query": {
+            "id": "1", "chat_instance": "bench", "data": "status",
+            "from": {"id": 1, "is_bot": False, "first_name": "bench"},
+            "message": {
+                "message_id": 5, "date": 0, "text": text, "chat": {"id": 1, "type": "private"},
+                "reply_markup": markup.model_dump(exclude_none=True) if markup else None,
+            },
+        },
+    }, context={"bot": telegram_bot})
+    return update.callback_query.message
+
+def prepare(telegram_bot, message, text, markup):
+    method = EditMessageText(chat_id=message.chat.id, message_id=message.message_id, text=text, reply_markup=markup)
+    telegram_bot.session.build_form_data(telegram_bot, method)
+
+def measure(step) -> float:
+    start = time.process_time()
+    for _ in range(ITERATIONS):
+        step()
+    return (time.process_time() - start) / ITERATIONS * 1e6
+
+def main():
+    telegram_bot = bot.create_bot()
+    gen_data = GeneratorData(
+        id=1, power_output=2500.0, temperature=85.3, pressure=150.2, voltage=13800.0, frequency=50.0,
+        fuel_level=78.5, coolant_flow=450.0, turbine_rpm=3000.0, efficiency=94.2, vibration_level=2.1,
+        updated_at=datetime(2025, 1, 1, 12, 0, 0),
+    )
+    screens = {
+        "status": (legacy_status, lambda: bot.screen_cache.get("status", bot.render_status, gen_data)),
+        "generator": (legacy_generator, lambda: bot.GENERATOR_SCREEN),
+    }
+    print(f"{ITERATIONS} callbacks each, microseconds of CPU per callback")
+    print(f"{'screen':<10} {'legacy':>8} {'cached':>8} {'skipped':>8}")
+    for name, (legacy, cached) in screens.items():
+        # a message that shows another screen, and one that shows this one already
+        other = callback_message("old", None, telegram_bot)
+        screen = cached()
+        same = callback_message(screen.plain, screen.reply_markup, telegram_bot)
+        assert not screen.shown_in(other) and screen.shown_in(same)
+
+        def legacy_step():
+            text, markup = legacy(gen_data)
+            prepare(telegram_bot, other, text, markup)
+
+        def cached_step():
+            screen = cached()
+            if not screen.shown_in(other):
+                prepare(telegram_bot, other, screen.text, screen.reply_markup)
+
+        def skipped_step():
+            screen = cached()
+            if not screen.shown_in(same):
+                prepare(telegram_bot, same, screen.text, screen.reply_markup)
+
+        print(f"{name:<10} {measure(legacy_step):8.1f} {measure(cached_step):8.1f} {measure(skipped_step):8.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Telemetry ingest at 1 Hz and 100 Hz: a per-tick INSERT + COMMIT against COPY batches.
+
+Samples are stamped on a day far in the future so they land in a partition of
+their own, which is dropped again at the end.
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+
+sys.path[:0] = [
+    os.path.join(os.path.dirname(__file__), ".."),
+    os.path.join(os.path.dirname(__file__), "..", "bot"),
+]
+
+from sqlalchemy import insert
+from db.database import create_db_engine
+from db.models import TELEMETRY_METRICS, generator_telemetry
+from db.telemetry import TelemetryWriter, create_partition, partition_name
+
+GENERATORS = int(os.getenv("BENCH_GENERATORS", "4"))
+SECONDS = int(os.getenv("BENCH_SECONDS", "60"))
+BATCH_SIZE = int(os.getenv("BENCH_BATCH_SIZE", "1000"))
+BENCH_DAY = date(2099, 1, 1)
+
+def samples(rate: int):
+    start = datetime(BENCH_DAY.year, BENCH_DAY.month, BENCH_DAY.day, tzinfo=timezone.utc)
+    rng = random.Random(rate)
+    for tick in range(SECONDS * rate):
+        recorded_at = start + timedelta(seconds=tick / rate)
+        yield [(generator_id, recorded_at, [rng.random() for _ in TELEMETRY_METRICS]) for generator_id in range(1, GENERATORS + 1)]
+
+async def insert_per_tick(engine, rate: int) -> int:
+    rows = 0
+    for tick in samples(rate):
+        async with engine.begin() as conn:
+            for generator_id, recorded_at, values in tick:
+                await conn.execute(insert(generator_telemetry).values(
+                    generator_id=generator_id, recorded_at=recorded_at, **dict(zip(TELEMETRY_METRICS, values))
+                ))
+                rows += 1
+    return rows
+
+async def copy_batches(engine, rate: int) -> int:
+    writer = TelemetryWriter(engine, batch_size=BATCH_SIZE)
+    for tick in samples(rate):
+        # one timestamp per tick, as the updater stages them
+        writer.add_many([row[0] for row in tick], tick[0][1], [row[2] for row in tick])
+        if writer.pending() >= BATCH_SIZE:
+            await writer.flush()
+    await writer.flush()
+    return writer.written
+
+async def main():
+    engine = create_db_engine()
+    async with engine.begin() as conn:
+        await conn.run_sync(generator_telemetry.create, checkfirst=True)
+        await create_partition(conn, BENCH_DAY)
+    print(f"{GENERATORS} generators, {SECONDS}s of samples, COPY batch {BATCH_SIZE}")
+    try:
+        for rate in (1, 100):
+            for name, ingest in (("insert/tick", insert_per_tick), ("copy", copy_batches)):
+                start = time.perf_counter()
+                rows = await ingest(engine, rate)
+                elapsed = time.perf_counter() - start
+                print(
+                    f"{rate:>3} Hz  {name:<12} {rows:7d} rows {elapsed:7.2f}s  {rows / elapsed:10.0f} rows/s"
+                    f"  {SECONDS / elapsed:8.1f}x real time"
+                )
+                async with engine.begin() as conn:
+                    await conn.exec_driver_sql(f"TRUNCATE {partition_name(BENCH_DAY)}")
+    finally:
+        async with engine.begin() as conn:
+            await conn.exec_driver_sql(f"DROP TABLE IF EXISTS {partition_name(BENCH_DAY)}")
+        await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path[:0] = [
+    os.path.join(os.path.dirname(__file__), ".."),
+    os.path.join(os.path.dirname(__file__), "..", "bot"),
+]
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from transport import TunedAiohttpSession
+
+CALLS = int(os.getenv("BENCH_CALLS", "2000"))
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "16"))
+PORT = int(os.getenv("BENCH_STUB_PORT", "18081"))
+STUB_LATENCY = os.getenv("BENCH_STUB_LATENCY", "0")
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+async def run(name, session):
+    bot = Bot("42:BENCH", session=session)
+    timings = {"sendMessage": [], "editMessageText": []}
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def call(i):
+        async with semaphore:
+            start = time.perf_counter()
+            if i % 2:
+                await bot.edit_message_text(text=f"edit {i}", chat_id=i % 100, message_id=i)
+                timings["editMessageText"].append(time.perf_counter() - start)
+            else:
+                await bot.send_message(chat_id=i % 100, text=f"send {i}")
+                timings["sendMessage"].append(time.perf_counter() - start)
+
+    await asyncio.gather(*(call(i) for i in range(50)))
+    for samples in timings.values():
+        samples.clear()
+    start = time.perf_counter()
+    await asyncio.gather(*(call(i) for i in range(CALLS)))
+    elapsed = time.perf_counter() - start
+    await bot.session.close()
+    for method, samples in timings.items():
+        print(
+            f"{name:<14} {method:<16} p50 {percentile(samples, 0.5) * 1000:7.3f}ms"
+            f"  p99 {percentile(samples, 0.99) * 1000:7.3f}ms"
+        )
+    print(f"{name:<14} {'total':<16} {CALLS / elapsed:9.1f} calls/s")
+
+async def main(socket_path):
+    api = TelegramAPIServer.from_base(f"http://127.0.0.1:{PORT}")
+    print(f"{CALLS} calls, concurrency {CONCURRENCY}, stub latency {STUB_LATENCY}s")
+    await run("before", AiohttpSession(api=api))
+    await run("tuned-tcp", TunedAiohttpSession(api=api, limit=CONCURRENCY))
+    await run("tuned-unix", TunedAiohttpSession(api=api, limit=CONCURRENCY, unix_socket=socket_path))
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        socket_path = os.path.join(tmp, "bot-api.sock")
+        stub = subprocess.Popen(
+            [sys.executable, os.path.join(os.path.dirname(__file__), "stub_bot_api.py"),
+             "--port", str(PORT), "--unix", socket_path, "--latency", STUB_LATENCY],
+            stdout=subprocess.PIPE, text=True,
+        )
+        try:
+            stub.stdout.readline()
+            asyncio.run(main(socket_path))
+        finally:
+            stub.terminate()
+            stub.wait()
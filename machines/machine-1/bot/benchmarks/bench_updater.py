@@ -0,0 +1,130 @@
+"""Updater tick latency and database CPU against the number of simulated generators.
+
+orm:        SELECT the rows, walk each attribute with random.uniform/max/min, commit (the original tick)
+unnest:     one vectorized step, UPDATE ... FROM unnest(...) inside BEGIN/COMMIT, the row trigger
+            notifies and a listener SELECTs the row back
+statement:  simulation.TICK_STATEMENT in autocommit: clipped in SQL, RETURNING, snapshots published
+            with pg_notify and the trigger kept quiet, so nothing is read back
+
+DB CPU is utime + stime of the server backend taken from /proc/<pid>/stat, so it is only
+reported when the database runs on this host; the re-query of the unnest variant is included.
+Generators added for the run are deleted again at the end.
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path[:0] = [
+    os.path.join(os.path.dirname(__file__), ".."),
+    os.path.join(os.path.dirname(__file__), "..", "updater"),
+]
+
+from sqlalchemy import Float, Integer, bindparam, select, delete, func, text
+from sqlalchemy.dialects.postgresql import ARRAY
+from db.database import create_db_engine, create_session_maker
+from db.models import GeneratorData
+from db.notify import install_notify_triggers
+
+from simulation import LIMITS, METRICS, TICK_STATEMENT, load_simulation
+
+COUNTS = [int(count) for count in os.getenv("BENCH_GENERATORS", "1,4,100,1000,5000").split(",")]
+TICKS = int(os.getenv("BENCH_TICKS", "20"))
+NOTIFY_LIMIT = int(os.getenv("BENCH_NOTIFY_LIMIT", "100"))
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+# the tick this replaced: values clipped in Python and written back in an explicit transaction
+UNNEST_STATEMENT = text(
+    f"UPDATE generator_data AS g SET {', '.join(f'{metric} = d.{metric}' for metric in METRICS)}, updated_at = now() "
+    f"FROM unnest(:ids, {', '.join(f':{metric}' for metric in METRICS)}) AS d(id, {', '.join(METRICS)}) "
+    "WHERE g.id = d.id"
+).bindparams(bindparam("ids", type_=ARRAY(Integer)), *(bindparam(metric, type_=ARRAY(Float)) for metric in METRICS))
+
+def backend_cpu(pid: int):
+    try:
+        with open(f"/proc/{pid}/stat") as stat:
+            fields = stat.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+async def orm_tick(session_maker, count: int) -> None:
+    async with session_maker() as session:
+        result = await session.execute(select(GeneratorData).where(GeneratorData.id <= count))
+        for gen_data in result.scalars():
+            for metric in METRICS:
+                lower, upper, down, up, _ = LIMITS[metric]
+                setattr(gen_data, metric, max(lower, min(upper, getattr(gen_data, metric) + random.uniform(down, up))))
+        await session.commit()
+
+async def unnest_tick(engine, simulation, values) -> None:
+    step = simulation.step()
+    for index, metric in enumerate(METRICS):
+        lower, upper = LIMITS[metric][:2]
+        values[index] = [max(lower, min(upper, value + delta)) for value, delta in zip(values[index], step[metric])]
+    async with engine.begin() as conn:
+        await conn.execute(UNNEST_STATEMENT, {"ids": step["ids"], **dict(zip(METRICS, values))})
+    # what a listener then did for the generator it watches
+    async with engine.connect() as conn:
+        await conn.execute(select(GeneratorData).where(GeneratorData.id == 1))
+
+async def statement_tick(engine, simulation) -> None:
+    async with engine.connect() as conn:
+        result = await conn.execute(TICK_STATEMENT, {**simulation.step(), "notify_limit": NOTIFY_LIMIT})
+        result.all()
+
+async def measure(engine, tick, *args):
+    async with engine.connect() as conn:
+        pid = (await conn.execute(text("SELECT pg_backend_pid()"))).scalar()
+        cpu_before = backend_cpu(pid)
+    times = []
+    for _ in range(TICKS):
+        start = time.perf_counter()
+        await tick(*args)
+        times.append(time.perf_counter() - start)
+    async with engine.connect() as conn:
+        cpu_after = backend_cpu(pid)
+    times.sort()
+    p99 = times[min(len(times) - 1, int(len(times) * 0.99))]
+    cpu = None if cpu_before is None or cpu_after is None else (cpu_after - cpu_before) / TICKS
+    return statistics.median(times), p99, cpu
+
+def cell(result) -> str:
+    p50, p99, cpu = result
+    return f"{p50 * 1000:8.1f} {p99 * 1000:8.1f} {'n/a' if cpu is None else f'{cpu * 1000:.1f}':>8}"
+
+async def main():
+    # one connection in the pool, so every statement of a variant runs on the same backend
+    os.environ.update(DB_POOL_SIZE="1", DB_MAX_OVERFLOW="0")
+    engine = create_db_engine()
+    autocommit_engine = engine.execution_options(isolation_level="AUTOCOMMIT")
+    session_maker = create_session_maker(engine)
+    async with engine.begin() as conn:
+        await install_notify_triggers(conn)
+        existing = (await conn.execute(select(func.max(GeneratorData.id)))).scalar() or 0
+
+    try:
+        header = " ".join(f"{name + ' p50':>8} {'p99':>8} {'cpu ms':>8}" for name in ("orm", "unnest", "stmt"))
+        print(f"{TICKS} ticks per variant, times in ms per tick\n{'generators':>10} {header}")
+        for count in COUNTS:
+            async with engine.begin() as conn:
+                simulation = await load_simulation(conn, count)
+                rows = (await conn.execute(select(*(getattr(GeneratorData, metric) for metric in METRICS))
+                                           .where(GeneratorData.id.in_(simulation.ids.tolist()))
+                                           .order_by(GeneratorData.id))).all()
+            values = [list(column) for column in zip(*rows)]
+
+            orm = await measure(engine, orm_tick, session_maker, count)
+            unnest = await measure(engine, unnest_tick, engine, simulation, values)
+            statement = await measure(autocommit_engine, statement_tick, autocommit_engine, simulation)
+            print(f"{count:>10} {cell(orm)} {cell(unnest)} {cell(statement)}")
+    finally:
+        async with session_maker() as session:
+            await session.execute(delete(GeneratorData).where(GeneratorData.id > existing))
+            await session.commit()
+        await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
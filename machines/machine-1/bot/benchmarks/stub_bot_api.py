@@ -0,0 +1,63 @@
+"""Minimal stand-in for telegram-bot-api: answers every method with a canned success.
+
+    python stub_bot_api.py --port 8081 [--unix /tmp/bot-api.sock] [--latency 0.002]
+"""
+import argparse
+import asyncio
+import time
+
+from aiohttp import web
+
+def message_result(form, message_id: int) -> dict:
+    chat_id = int(form.get("chat_id", 0) or 0)
+    return {
+        "message_id": int(form.get("message_id", message_id) or message_id),
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "text": form.get("text", ""),
+    }
+
+MESSAGE_METHODS = {"sendMessage", "editMessageText", "editMessageReplyMarkup", "sendPhoto", "sendDocument"}
+
+def create_app(latency: float = 0.0) -> web.Application:
+    counter = 0
+
+    async def handle(request: web.Request) -> web.Response:
+        nonlocal counter
+        counter += 1
+        method = request.match_info["method"]
+        form = await request.post()
+        if latency:
+            await asyncio.sleep(latency)
+        if method == "getMe":
+            result = {"id": 42, "is_bot": True, "first_name": "stub", "username": "stub_bot"}
+        elif method in MESSAGE_METHODS:
+            result = message_result(form, counter)
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", handle)
+    return app
+
+async def serve(host: str, port: int, unix: str = None, latency: float = 0.0) -> web.AppRunner:
+    runner = web.AppRunner(create_app(latency), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    if unix:
+        await web.UnixSite(runner, unix).start()
+    return runner
+
+async def main(args: argparse.Namespace) -> None:
+    await serve(args.host, args.port, args.unix, args.latency)
+    print("ready", flush=True)
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--unix")
+    parser.add_argument("--latency", type=float, default=0.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,238 @@
+import asyncio
+import itertools
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional, Sequence, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError
+
+from sqlalchemy import select, update, delete
+from sqlalchemy.dialects.postgresql import insert
+from db.models import AlertState, AlertSubscription
+
+from metrics import registry
+
+LEVEL_OK = 0
+LEVEL_WARNING = 1
+LEVEL_CRITICAL = 2
+
+logger = logging.getLogger(__name__)
+
+alert_transitions = registry.counter("bot_alert_transitions_total", "Threshold level changes", ("metric", "level"))
+alerts_sent = registry.counter("bot_alerts_sent_total", "Alert messages delivered")
+alerts_suppressed = registry.counter("bot_alerts_suppressed_total", "Alert messages skipped as a repeat for the chat")
+alert_latency = registry.histogram(
+    "bot_alert_latency_seconds", "Time from the generator change notification to the alert being sent",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0),
+)
+
+@dataclass(frozen=True)
+class Threshold:
+    metric: str
+    label: str
+    unit: str
+    warning: float
+    critical: float
+    hysteresis: float
+    below: bool = False
+
+    def level(self, value: float, current: int = LEVEL_OK) -> int:
+        # thresholds on a falling value are mirrored so the comparisons below stay one-sided
+        sign = -1 if self.below else 1
+        value *= sign
+        bounds = (self.warning * sign, self.critical * sign)
+        level = sum(value >= bound for bound in bounds)
+        # a raised level only drops once the value is clear of its bound by the hysteresis band
+        for candidate in range(current, level, -1):
+            if value > bounds[candidate - 1] - self.hysteresis:
+                return candidate
+        return level
+
+    def bound(self, level: int) -> float:
+        return self.critical if level == LEVEL_CRITICAL else self.warning
+
+TEMPERATURE = Threshold("temperature", "🌡️ Температура", "°C", warning=120.0, critical=150.0, hysteresis=5.0)
+DEFAULT_THRESHOLDS = (
+    TEMPERATURE,
+    Threshold("vibration_level", "📊 Вибрация", " мм/с", warning=4.5, critical=7.1, hysteresis=0.3),
+    Threshold("fuel_level", "🔋 Топливо", "%", warning=20.0, critical=10.0, hysteresis=2.0, below=True),
+)
+
+def render_alert(threshold: Threshold, level: int, value: float) -> str:
+    if level == LEVEL_OK:
+        return f"✅ <b>НОРМА</b>\n\n{threshold.label}: <b>{value:.1f}{threshold.unit}</b>"
+    title = "🚨 <b>КРИТИЧЕСКИЙ УРОВЕНЬ</b>" if level == LEVEL_CRITICAL else "⚠️ <b>ПРЕДУПРЕЖДЕНИЕ</b>"
+    return (
+        f"{title}\n\n{threshold.label}: <b>{value:.1f}{threshold.unit}</b> "
+        f"(порог {threshold.bound(level):.1f}{threshold.unit})"
+    )
+
+class AlertEngine:
+    """Evaluates thresholds on every generator change and fans level changes out to subscribed chats.
+
+    A level change is claimed with a conditional UPDATE of alert_states, so with several
+    workers or replicas exactly one process sends each alert.
+    """
+
+    def __init__(
+        self,
+        session_maker,
+        snapshot: Callable[[], Awaitable],
+        thresholds: Sequence[Threshold] = DEFAULT_THRESHOLDS,
+        senders: int = 8,
+        cooldown: float = 300.0,
+        max_dedup: int = 100000,
+    ):
+        self.session_maker = session_maker
+        self.snapshot = snapshot
+        self.thresholds = tuple(thresholds)
+        self.senders = senders
+        self.cooldown = cooldown
+        self.max_dedup = max_dedup
+        self.evaluations = 0
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._sequence = itertools.count()
+        self._recent: OrderedDict = OrderedDict()
+        self._wakeup = asyncio.Event()
+        self._notified_at: Optional[float] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def notify(self, payload: str = None) -> None:
+        # several notifications during one evaluation collapse into a single re-run
+        if self._notified_at is None:
+            self._notified_at = time.perf_counter()
+        self._wakeup.set()
+
+    async def start(self, bot: Bot) -> None:
+        if self._tasks:
+            return
+        async with self.session_maker() as session:
+            await session.execute(
+                insert(AlertState)
+                .values([{"metric": threshold.metric, "level": LEVEL_OK} for threshold in self.thresholds])
+                .on_conflict_do_nothing(index_elements=[AlertState.metric])
+            )
+            await session.commit()
+        self._tasks = [asyncio.create_task(self._run())]
+        self._tasks += [asyncio.create_task(self._send_loop(bot)) for _ in range(self.senders)]
+        self.notify()
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            notified_at, self._notified_at = self._notified_at, None
+            try:
+                await self.evaluate(notified_at)
+            except Exception as e:
+                logger.error(f"Alert evaluation failed: {e}")
+
+    async def evaluate(self, notified_at: Optional[float] = None) -> List[Tuple[Threshold, int, int, float]]:
+        self.evaluations += 1
+        notified_at = notified_at or time.perf_counter()
+        snapshot = await self.snapshot()
+        if snapshot is None:
+            return []
+        transitions = []
+        async with self.session_maker() as session:
+            levels = dict((await session.execute(select(AlertState.metric, AlertState.level))).all())
+            for threshold in self.thresholds:
+                value = getattr(snapshot, threshold.metric)
+                previous = levels.get(threshold.metric, LEVEL_OK)
+                level = threshold.level(value, previous)
+                if level == previous:
+                    continue
+                claimed = await session.execute(
+                    update(AlertState)
+                    .where(AlertState.metric == threshold.metric, AlertState.level == previous)
+                    .values(level=level, value=value)
+                    .returning(AlertState.metric)
+                )
+                if claimed.first() is not None:
+                    transitions.append((threshold, previous, level, value))
+            await session.commit()
+            if not transitions:
+                return []
+            subscribers = (await session.execute(select(AlertSubscription.chat_id, AlertSubscription.min_level))).all()
+        for threshold, previous, level, value in transitions:
+            alert_transitions.inc(threshold.metric, str(level))
+            logger.info(f"Alert {threshold.metric}: level {previous} -> {level} at {value:.2f}")
+            self._fan_out(subscribers, threshold, previous, level, value, notified_at)
+        return transitions
+
+    def _fan_out(self, subscribers, threshold: Threshold, previous: int, level: int, value: float, notified_at: float) -> None:
+        text = render_alert(threshold, level, value)
+        # a recovery goes to everyone who was told about the level it recovers from
+        severity = max(previous, level)
+        for chat_id, min_level in subscribers:
+            if severity < min_level:
+                continue
+            if self._is_repeat(chat_id, threshold.metric, level):
+                alerts_suppressed.inc()
+                continue
+            # critical alerts overtake anything still queued
+            self._queue.put_nowait((-severity, next(self._sequence), chat_id, text, notified_at))
+
+    def _is_repeat(self, chat_id: int, metric: str, level: int) -> bool:
+        key = (chat_id, metric)
+        now = time.monotonic()
+        recent = self._recent.get(key)
+        if recent is not None and recent[0] == level and now - recent[1] < self.cooldown:
+            return True
+        self._recent[key] = (level, now)
+        self._recent.move_to_end(key)
+        while len(self._recent) > self.max_dedup:
+            self._recent.popitem(last=False)
+        return False
+
+    async def _send_loop(self, bot: Bot) -> None:
+        while True:
+            _, _, chat_id, text, notified_at = await self._queue.get()
+            try:
+                await bot.send_message(chat_id, text)
+                alerts_sent.inc()
+                alert_latency.observe(time.perf_counter() - notified_at)
+            except TelegramForbiddenError:
+                # the user blocked the bot
+                async with self.session_maker() as session:
+                    await self.unsubscribe(session, chat_id)
+            except Exception as e:
+                logger.error(f"Failed to send alert to {chat_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def join(self) -> None:
+        await self._queue.join()
+
+    async def subscribe(self, session, chat_id: int, min_level: int = LEVEL_WARNING) -> None:
+        stmt = insert(AlertSubscription).values(chat_id=chat_id, min_level=min_level)
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=[AlertSubscription.chat_id],
+            set_={"min_level": stmt.excluded.min_level},
+        ))
+        await session.commit()
+
+    async def unsubscribe(self, session, chat_id: int) -> None:
+        await session.execute(delete(AlertSubscription).where(AlertSubscription.chat_id == chat_id))
+        await session.commit()
+
+    async def subscription(self, session, chat_id: int) -> Optional[int]:
+        result = await session.execute(select(AlertSubscription.min_level).where(AlertSubscription.chat_id == chat_id))
+        return result.scalar_one_or_none()
+
+    def stats(self) -> dict:
+        return {
+            "evaluations": self.evaluations,
+            "queued": self._queue.qsize(),
+            "sent": int(alerts_sent.value()),
+            "suppressed": int(alerts_suppressed.value()),
+        }
@@ -1,41 +1,204 @@
+import asyncio
 import logging
+import multiprocessing
+import multiprocessing.connection
+import signal
 import sys
 import os
 from datetime import datetime
 from typing import Callable, Awaitable
 
-from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.client.telegram import TelegramAPIServer
 from aiohttp import web
 
-from aiogram import Bot, Dispatcher, Router, F
+from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
-from aiogram.filters import CommandStart, Command
-from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
-from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiogram.filters import CommandStart, Command, CommandObject
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, BufferedInputFile
+from aiogram.webhook.aiohttp_server import setup_application
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
 
-from sqlalchemy import select
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from db.models import Base, GeneratorData, User
-from db.database import create_db_engine, create_session_maker
+from db.database import create_db_engine, create_session_maker, warm_pool
+from db.notify import (
+    NotificationListener,
+    GENERATOR_CHANNEL,
+    GENERATOR_SNAPSHOT_CHANNEL,
+    USERS_CHANNEL,
+    install_notify_triggers,
+    generator_ids,
+    parse_generator_snapshot,
+)
+from live import LiveMonitorBroadcaster
+from trends import TrendHistory
+from charts import ChartRenderer
+from screens import Screen, ScreenCache, edit_screen
+from callbacks import ChartCallback, IndexedRouter
+from codec import get_codec
+from alerts import AlertEngine, TEMPERATURE, LEVEL_WARNING, LEVEL_CRITICAL
+from cache import CachedUser, GeneratorSnapshotCache, UserCache
+from middlewares import DbSessionMiddleware, UpdateMetricsMiddleware, HandlerTimingMiddleware, ApiTimingMiddleware, release_current_session
+from metrics import registry, instrument_engine, http_in_flight
+from outbound import OutboundRateLimiter
+from request_log import RequestLogWriter, create_request_log_middleware, parse_sample_rates
+from webhook import DedupRequestHandler, QueuedRequestHandler, create_internal_guard_middleware, create_webhook_guard_middleware, parse_allowed_networks
+from dedup import SharedUpdateLog, UpdateDeduplicator
+from storage import PostgresStorage
+from transport import TunedAiohttpSession, parse_method_timeouts
 
 TOKEN = os.getenv("BOT_TOKEN")
 ADMIN_ID = int(os.getenv("ADMIN_ID", "0"))
 SSH_USER_PASSWORD = os.getenv("SSH_USER_PASSWORD")
 TELEGRAM_BOT_API_URL = os.getenv("TELEGRAM_BOT_API_URL")
+GENERATOR_ID = int(os.getenv("GENERATOR_ID", "1"))
 WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
 WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
 WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# both off while empty; the secret is registered with set_webhook and checked on every POST
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+WEBHOOK_ALLOWED_IPS = parse_allowed_networks(os.getenv("WEBHOOK_ALLOWED_IPS", ""))
 DOCS_PUBLIC_URL = os.getenv("DOCS_PUBLIC_URL")
 BASE_WEBHOOK_URL = f"http://{WEBHOOK_HOST}:{WEBHOOK_PORT}"
+GENERATOR_CACHE_TTL = float(os.getenv("GENERATOR_CACHE_TTL", "60"))
+GENERATOR_CACHE_FALLBACK_TTL = float(os.getenv("GENERATOR_CACHE_FALLBACK_TTL", "5"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+STATS_PATH = os.getenv("STATS_PATH", "/stats")
+METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
+# with a port set, /stats and /metrics move off the public port onto this listener
+INTERNAL_HOST = os.getenv("INTERNAL_HOST", "0.0.0.0")
+INTERNAL_PORT = int(os.getenv("INTERNAL_PORT", "0"))
+# who may read them on the public port
+INTERNAL_ALLOWED_IPS = parse_allowed_networks(os.getenv("INTERNAL_ALLOWED_IPS", "127.0.0.0/8,::1"))
+REQUEST_LOG_SAMPLE_RATES = parse_sample_rates(os.getenv("REQUEST_LOG_SAMPLE_RATES", f"{METRICS_PATH}=0,{STATS_PATH}=0"))
+REQUEST_LOG_DEFAULT_RATE = float(os.getenv("REQUEST_LOG_DEFAULT_RATE", "1"))
+REQUEST_LOG_MAX_BODY = int(os.getenv("REQUEST_LOG_MAX_BODY", "2048"))
+REQUEST_LOG_QUEUE_SIZE = int(os.getenv("REQUEST_LOG_QUEUE_SIZE", "10000"))
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+OUTBOUND_CHAT_BURST = float(os.getenv("OUTBOUND_CHAT_BURST", "3"))
+TELEGRAM_API_CONNECTIONS = int(os.getenv("TELEGRAM_API_CONNECTIONS", "100"))
+TELEGRAM_API_KEEPALIVE = float(os.getenv("TELEGRAM_API_KEEPALIVE", "30"))
+TELEGRAM_API_DNS_TTL = int(os.getenv("TELEGRAM_API_DNS_TTL", "3600"))
+# path of a unix socket in front of telegram-bot-api; TELEGRAM_BOT_API_URL still supplies the Host header
+TELEGRAM_API_SOCKET = os.getenv("TELEGRAM_API_SOCKET") or None
+TELEGRAM_API_TIMEOUTS = parse_method_timeouts(os.getenv("TELEGRAM_API_TIMEOUTS", ""))
+TELEGRAM_API_RETRIES = int(os.getenv("TELEGRAM_API_RETRIES", "2"))
+ALERT_SENDERS = int(os.getenv("ALERT_SENDERS", "8"))
+ALERT_COOLDOWN = float(os.getenv("ALERT_COOLDOWN", "300"))
+LIVE_MONITOR_INTERVAL = float(os.getenv("LIVE_MONITOR_INTERVAL", "10"))
+LIVE_MONITOR_TTL = float(os.getenv("LIVE_MONITOR_TTL", "3600"))
+TREND_WINDOW = float(os.getenv("TREND_WINDOW", "86400"))
+# 24 h of samples at the updater's default 10 s interval
+TREND_CAPACITY = int(os.getenv("TREND_CAPACITY", "8640"))
+TREND_POINTS = int(os.getenv("TREND_POINTS", "24"))
+TREND_HOURS = max(1, int(TREND_WINDOW // 3600))
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", "2"))
+CHART_CACHE_SIZE = int(os.getenv("CHART_CACHE_SIZE", "64"))
+CHART_WIDTH = int(os.getenv("CHART_WIDTH", "800"))
+CHART_HEIGHT = int(os.getenv("CHART_HEIGHT", "400"))
+# auto picks orjson when it is installed
+JSON_CODEC = get_codec(os.getenv("JSON_CODEC", "auto"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "0"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+WEBHOOK_BACKPRESSURE = os.getenv("WEBHOOK_BACKPRESSURE", "reject")
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))
+# worker processes cannot share MemoryStorage, so pre-fork mode always uses postgres
+FSM_STORAGE = "postgres" if WEB_WORKERS > 1 else os.getenv("FSM_STORAGE", "memory")
+# a per-process read cache or write-behind buffer would let workers diverge
+FSM_CACHE_TTL = 0.0 if WEB_WORKERS > 1 else float(os.getenv("FSM_CACHE_TTL", "300"))
+FSM_FLUSH_INTERVAL = 0.0 if WEB_WORKERS > 1 else float(os.getenv("FSM_FLUSH_INTERVAL", "1"))
+FSM_STATE_TTL = float(os.getenv("FSM_STATE_TTL", "86400"))
+# update_ids remembered against redeliveries; 0 feeds every delivery
+UPDATE_DEDUP_SIZE = int(os.getenv("UPDATE_DEDUP_SIZE", "0"))
+# a redelivery may reach another worker, so pre-fork mode checks the shared table too
+UPDATE_DEDUP_BACKEND = "postgres" if WEB_WORKERS > 1 else os.getenv("UPDATE_DEDUP_BACKEND", "memory")
 
 engine = create_db_engine()
 async_session_maker = create_session_maker(engine)
+instrument_engine(engine)
+registry.gauge("bot_db_pool_checked_out", "Connections currently checked out", function=lambda: engine.pool.checkedout())
+registry.gauge("bot_db_pool_overflow", "Connections open beyond pool_size", function=lambda: max(engine.pool.overflow(), 0))
+registry.gauge("bot_db_pool_waits", "Checkouts that had to wait for a connection", function=lambda: engine.pool.waits)
+
+listener = NotificationListener()
+generator_cache = GeneratorSnapshotCache(
+    async_session_maker,
+    listener,
+    ttl=GENERATOR_CACHE_TTL,
+    fallback_ttl=GENERATOR_CACHE_FALLBACK_TTL,
+    generator_id=GENERATOR_ID,
+)
+listener.on_connect(generator_cache.invalidate)
+alert_engine = AlertEngine(async_session_maker, generator_cache.get, senders=ALERT_SENDERS, cooldown=ALERT_COOLDOWN)
+listener.on_connect(alert_engine.notify)
+# the renderers are defined further down; the broadcaster only calls them once started
+trend_history = TrendHistory(GENERATOR_ID, window=TREND_WINDOW, capacity=TREND_CAPACITY, points=TREND_POINTS)
+chart_renderer = ChartRenderer(
+    trend_history, workers=CHART_WORKERS, cache_size=CHART_CACHE_SIZE, width=CHART_WIDTH, height=CHART_HEIGHT
+)
+live_monitor = LiveMonitorBroadcaster(
+    async_session_maker,
+    generator_cache.get,
+    lambda gen_data: render_live_monitoring(gen_data),
+    interval=LIVE_MONITOR_INTERVAL,
+    ttl=LIVE_MONITOR_TTL,
+)
+
+def on_generator_changed(payload: str) -> None:
+    ids = generator_ids(payload)
+    if ids is not None and GENERATOR_ID not in ids:
+        return
+    # the cache first, so the evaluation and the live render read the row that was just committed
+    generator_cache.invalidate(payload)
+    alert_engine.notify(payload)
+    live_monitor.notify(payload)
+
+def on_generator_snapshot(payload: str) -> None:
+    snapshot = parse_generator_snapshot(payload)
+    if snapshot["id"] != GENERATOR_ID:
+        return
+    # the payload is the committed row, so nothing has to be read back
+    gen_data = GeneratorData(**snapshot)
+    generator_cache.put(gen_data)
+    trend_history.observe(gen_data)
+    alert_engine.notify(payload)
+    live_monitor.notify(payload)
+
+listener.add_listener(GENERATOR_CHANNEL, on_generator_changed)
+listener.add_listener(GENERATOR_SNAPSHOT_CHANNEL, on_generator_snapshot)
+user_cache = UserCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+# other replicas announce /promote through NOTIFY
+listener.add_listener(USERS_CHANNEL, user_cache.invalidate)
+listener.on_connect(user_cache.clear)
+
+update_dedup = None
+if UPDATE_DEDUP_SIZE > 0:
+    update_dedup = UpdateDeduplicator(
+        UPDATE_DEDUP_SIZE,
+        shared=SharedUpdateLog(async_session_maker, window=UPDATE_DEDUP_SIZE) if UPDATE_DEDUP_BACKEND == "postgres" else None,
+    )
 
-router = Router()
-storage = MemoryStorage()
+request_log_writer = RequestLogWriter(max_queue=REQUEST_LOG_QUEUE_SIZE, dumps=JSON_CODEC.dumps)
+
+router = IndexedRouter()
+router.message.middleware(HandlerTimingMiddleware())
+router.callback_query.middleware(HandlerTimingMiddleware())
+if FSM_STORAGE == "postgres":
+    storage = PostgresStorage(
+        async_session_maker,
+        cache_ttl=FSM_CACHE_TTL,
+        flush_interval=FSM_FLUSH_INTERVAL,
+        state_ttl=FSM_STATE_TTL,
+    )
+else:
+    storage = MemoryStorage()
 
 logging.basicConfig(level=logging.INFO, stream=sys.stdout)
 logger = logging.getLogger(__name__)
@@ -47,10 +210,13 @@ class DiagnosticStates(StatesGroup):
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await install_notify_triggers(conn)
     async with async_session_maker() as session:
-        result = await session.execute(select(GeneratorData))
-        if not result.scalar_one_or_none():
-            gen_data = GeneratorData(
+        # the updater seeds the same rows; whichever comes first wins
+        await session.execute(
+            insert(GeneratorData)
+            .values(
+                id=GENERATOR_ID,
                 power_output=2500.0,
                 temperature=85.3,
                 pressure=150.2,
@@ -62,8 +228,9 @@ async def init_db():
                 efficiency=94.2,
                 vibration_level=2.1
             )
-            session.add(gen_data)
-            await session.commit()
+            .on_conflict_do_nothing(index_elements=[GeneratorData.id])
+        )
+        await session.commit()
         admin_result = await session.execute(select(User).where(User.telegram_id == ADMIN_ID))
         admin_user = admin_result.scalar_one_or_none()
         if not admin_user:
@@ -71,52 +238,94 @@ async def init_db():
             session.add(admin_user)
             await session.commit()
 
-async def get_or_create_user(telegram_id: int, username: str = None) -> User:
-    async with async_session_maker() as session:
-        result = await session.execute(select(User).where(User.telegram_id == telegram_id))
-        user = result.scalar_one_or_none()
-        if not user:
-            user = User(telegram_id=telegram_id, username=username, is_admin=(telegram_id == ADMIN_ID))
-            session.add(user)
-            await session.commit()
-            await session.refresh(user)
+def user_upsert_statement(telegram_id: int, username: str = None):
+    stmt = insert(User).values(telegram_id=telegram_id, username=username, is_admin=(telegram_id == ADMIN_ID))
+    # DO UPDATE rather than DO NOTHING so that RETURNING yields the existing row too
+    return stmt.on_conflict_do_update(
+        index_elements=[User.telegram_id],
+        set_={"username": func.coalesce(stmt.excluded.username, User.username)},
+    ).returning(User)
+
+async def load_or_create_user(session: AsyncSession, telegram_id: int, username: str = None) -> CachedUser:
+    # an unconditional upsert would write and fsync a tuple for every known user
+    result = await session.execute(select(User).where(User.telegram_id == telegram_id))
+    user = result.scalar_one_or_none()
+    if user is None:
+        result = await session.execute(user_upsert_statement(telegram_id, username))
+        user = CachedUser.from_row(result.scalar_one())
+        # committed here rather than with the update, so the snapshot is never of a row that gets rolled back
+        await session.commit()
         return user
+    return CachedUser.from_row(user)
 
-async def is_admin(telegram_id: int) -> bool:
-    async with async_session_maker() as session:
-        result = await session.execute(select(User).where(User.telegram_id == telegram_id))
-        user = result.scalar_one_or_none()
-        return user.is_admin if user else False
-
-def get_main_keyboard():
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="📊 Статус системы", callback_data="status")],
-        [InlineKeyboardButton(text="⚡ Параметры генератора", callback_data="generator")],
-        [InlineKeyboardButton(text="🔧 Диагностика", callback_data="diagnostics")],
-        [InlineKeyboardButton(text="📈 Мониторинг", callback_data="monitoring")],
-        [InlineKeyboardButton(text="⚙️ Настройки", callback_data="settings")],
-        [InlineKeyboardButton(text="Веб-интерфейс", url=DOCS_PUBLIC_URL)]
-    ])
-    return keyboard
-
-def get_generator_keyboard():
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🔋 Мощность", callback_data="gen_power")],
-        [InlineKeyboardButton(text="🌡️ Температура", callback_data="gen_temp")],
-        [InlineKeyboardButton(text="💨 Охлаждение", callback_data="gen_cooling")],
-        [InlineKeyboardButton(text="⚙️ Турбина", callback_data="gen_turbine")],
-        [InlineKeyboardButton(text="🔙 Назад", callback_data="back_main")]
-    ])
-    return keyboard
-
-async def get_generator_data():
-    async with async_session_maker() as session:
-        result = await session.execute(select(GeneratorData).limit(1))
-        return result.scalar_one_or_none()
+async def get_or_create_user(session: AsyncSession, telegram_id: int, username: str = None) -> CachedUser:
+    user = user_cache.get(telegram_id)
+    if user is not None:
+        return user
+    user = await load_or_create_user(session, telegram_id, username)
+    user_cache.put(user)
+    return user
+
+async def is_admin(session: AsyncSession, telegram_id: int) -> bool:
+    user = user_cache.get(telegram_id)
+    if user is not None:
+        return user.is_admin
+    result = await session.execute(select(User).where(User.telegram_id == telegram_id))
+    user = result.scalar_one_or_none()
+    if not user:
+        return False
+    user = CachedUser.from_row(user)
+    user_cache.put(user)
+    return user.is_admin
+
+MAIN_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="📊 Статус системы", callback_data="status")],
+    [InlineKeyboardButton(text="⚡ Параметры генератора", callback_data="generator")],
+    [InlineKeyboardButton(text="🔧 Диагностика", callback_data="diagnostics")],
+    [InlineKeyboardButton(text="📈 Мониторинг", callback_data="monitoring")],
+    [InlineKeyboardButton(text="⚙️ Настройки", callback_data="settings")],
+    [InlineKeyboardButton(text="Веб-интерфейс", url=DOCS_PUBLIC_URL)]
+])
+
+GENERATOR_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="🔋 Мощность", callback_data="gen_power")],
+    [InlineKeyboardButton(text="🌡️ Температура", callback_data="gen_temp")],
+    [InlineKeyboardButton(text="💨 Охлаждение", callback_data="gen_cooling")],
+    [InlineKeyboardButton(text="⚙️ Турбина", callback_data="gen_turbine")],
+    [InlineKeyboardButton(text="🔙 Назад", callback_data="back_main")]
+])
+
+CHART_METRICS = {
+    "power": ("⚡", "power_output", "Мощность", "МВт"),
+    "temperature": ("🌡️", "temperature", "Температура", "°C"),
+    "rpm": ("⚙️", "turbine_rpm", "Турбина", "об/мин"),
+}
+
+MONITORING_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="🔴 Live-режим", callback_data="monitoring_live")],
+    [
+        InlineKeyboardButton(text=f"{icon} График", callback_data=ChartCallback(metric=name, hours=TREND_HOURS).pack())
+        for name, (icon, _, _, _) in CHART_METRICS.items()
+    ],
+    *MAIN_KEYBOARD.inline_keyboard
+])
+
+LIVE_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="⏹ Остановить", callback_data="monitoring_stop")]
+])
+
+# screens that depend on the generator row are rendered once per snapshot, for every chat
+screen_cache = ScreenCache()
+
+async def get_generator_data(session: AsyncSession):
+    gen_data = await generator_cache.get(session)
+    # rows changed by anything but the updater only arrive through here
+    trend_history.observe(gen_data)
+    return gen_data
 
 @router.message(CommandStart())
-async def command_start_handler(message: Message) -> None:
-    user = await get_or_create_user(message.from_user.id, message.from_user.username)
+async def command_start_handler(message: Message, session: AsyncSession) -> None:
+    user = await get_or_create_user(session, message.from_user.id, message.from_user.username)
 
     welcome_text = f"""
 🔋 <b>Система управления генератором №1</b>
@@ -134,14 +343,10 @@ async def command_start_handler(message: Message) -> None:
 Используйте меню ниже для доступа к функциям системы.
     """
 
-    await message.answer(welcome_text, reply_markup=get_main_keyboard())
+    await message.answer(welcome_text, reply_markup=MAIN_KEYBOARD)
 
-@router.message(Command("status"))
-async def cmd_status(message: Message):
-    user = await get_or_create_user(message.from_user.id, message.from_user.username)
-    gen_data = await get_generator_data()
-
-    status_text = f"""
+def render_status(gen_data: GeneratorData) -> Screen:
+    return Screen(f"""
 📊 <b>СТАТУС СИСТЕМЫ</b>
 
 ⚡ Генератор: <b>АКТИВЕН</b>
@@ -155,15 +360,19 @@ async def cmd_status(message: Message):
 ⚙️ Турбина: <b>{gen_data.turbine_rpm:.0f} об/мин</b>
 
 ⏱️ Обновлено: {gen_data.updated_at.strftime('%Y-%m-%d %H:%M:%S')}
-    """
+    """, MAIN_KEYBOARD)
 
-    await message.answer(status_text, reply_markup=get_main_keyboard())
+@router.message(Command("status"))
+async def cmd_status(message: Message, session: AsyncSession):
+    user = await get_or_create_user(session, message.from_user.id, message.from_user.username)
+    screen = screen_cache.get("status", render_status, await get_generator_data(session))
+    await message.answer(screen.text, reply_markup=screen.reply_markup)
 
 @router.message(Command("promote"))
-async def cmd_promote(message: Message):
-    user = await get_or_create_user(message.from_user.id, message.from_user.username)
+async def cmd_promote(message: Message, session: AsyncSession):
+    user = await get_or_create_user(session, message.from_user.id, message.from_user.username)
 
-    if not await is_admin(message.from_user.id):
+    if not await is_admin(session, message.from_user.id):
         await message.answer("❌ <b>ОШИБКА ДОСТУПА</b>\n\nУ вас нет прав для выполнения этой команды.")
         return
 
@@ -175,30 +384,52 @@ async def cmd_promote(message: Message):
 
         target_id = int(args[1])
 
-        async with async_session_maker() as session:
-            result = await session.execute(select(User).where(User.telegram_id == target_id))
-            target_user = result.scalar_one_or_none()
+        result = await session.execute(select(User).where(User.telegram_id == target_id))
+        target_user = result.scalar_one_or_none()
 
-            if not target_user:
-                target_user = User(telegram_id=target_id, is_admin=True)
-                session.add(target_user)
-            else:
-                target_user.is_admin = True
+        if not target_user:
+            target_user = User(telegram_id=target_id, is_admin=True)
+            session.add(target_user)
+        else:
+            target_user.is_admin = True
 
-            await session.commit()
+        await session.execute(select(func.pg_notify(USERS_CHANNEL, str(target_id))))
+        # commit before invalidating so the next lookup cannot re-cache the old row
+        await session.commit()
+        user_cache.invalidate(target_id)
 
         await message.answer(f"✅ Пользователь {target_id} получил права администратора.")
 
     except ValueError:
         await message.answer("❌ Неверный формат ID пользователя.")
     except Exception as e:
+        await session.rollback()
         await message.answer(f"❌ Ошибка: {str(e)}")
 
+@router.message(Command("alerts"))
+async def cmd_alerts(message: Message, command: CommandObject, session: AsyncSession):
+    mode = (command.args or "").strip().lower()
+    if mode == "on":
+        await alert_engine.subscribe(session, message.chat.id, LEVEL_WARNING)
+    elif mode == "critical":
+        await alert_engine.subscribe(session, message.chat.id, LEVEL_CRITICAL)
+    elif mode == "off":
+        await alert_engine.unsubscribe(session, message.chat.id)
+
+    level = await alert_engine.subscription(session, message.chat.id)
+    status = {LEVEL_WARNING: "все предупреждения", LEVEL_CRITICAL: "только критические"}.get(level, "отключены")
+    await message.answer(
+        f"🔔 <b>Оповещения</b>: {status}\n\n"
+        "/alerts on — все предупреждения\n"
+        "/alerts critical — только критические\n"
+        "/alerts off — отключить"
+    )
+
 @router.message(Command("get_remote_pass"))
-async def cmd_get_remote_pass(message: Message):
-    user = await get_or_create_user(message.from_user.id, message.from_user.username)
+async def cmd_get_remote_pass(message: Message, session: AsyncSession):
+    user = await get_or_create_user(session, message.from_user.id, message.from_user.username)
 
-    if not await is_admin(message.from_user.id):
+    if not await is_admin(session, message.from_user.id):
         await message.answer("❌ <b>ОШИБКА ДОСТУПА</b>\n\nУ вас нет прав для выполнения этой команды.")
         return
 
@@ -207,44 +438,24 @@ async def cmd_get_remote_pass(message: Message):
         f"Пароль для доступа по <b>защищенному каналу</b>: <code>{SSH_USER_PASSWORD}</code>\n\n"
     )
 
-@router.callback_query(F.data == "status")
-async def callback_status(callback: CallbackQuery):
-    gen_data = await get_generator_data()
-
-    status_text = f"""
-📊 <b>СТАТУС СИСТЕМЫ</b>
-
-⚡ Генератор: <b>АКТИВЕН</b>
-🔌 Мощность: <b>{gen_data.power_output:.1f} МВт</b>
-🌡️ Температура: <b>{gen_data.temperature:.1f}°C</b>
-💨 Давление: <b>{gen_data.pressure:.1f} кПа</b>
-📊 Эффективность: <b>{gen_data.efficiency:.1f}%</b>
-
-🔋 Топливо: <b>{gen_data.fuel_level:.1f}%</b>
-💧 Охлаждение: <b>{gen_data.coolant_flow:.1f} л/мин</b>
-⚙️ Турбина: <b>{gen_data.turbine_rpm:.0f} об/мин</b>
-
-⏱️ Обновлено: {gen_data.updated_at.strftime('%Y-%m-%d %H:%M:%S')}
-    """
-
-    await callback.message.edit_text(status_text, reply_markup=get_main_keyboard())
+@router.callback_query.data("status")
+async def callback_status(callback: CallbackQuery, session: AsyncSession):
+    await edit_screen(callback.message, screen_cache.get("status", render_status, await get_generator_data(session)))
     await callback.answer()
 
-@router.callback_query(F.data == "generator")
-async def callback_generator(callback: CallbackQuery):
-    text = """
+GENERATOR_SCREEN = Screen("""
 ⚡ <b>ПАРАМЕТРЫ ГЕНЕРАТОРА</b>
 
 Выберите параметр для просмотра детальной информации:
-    """
-    await callback.message.edit_text(text, reply_markup=get_generator_keyboard())
-    await callback.answer()
+    """, GENERATOR_KEYBOARD)
 
-@router.callback_query(F.data == "gen_power")
-async def callback_gen_power(callback: CallbackQuery):
-    gen_data = await get_generator_data()
+@router.callback_query.data("generator")
+async def callback_generator(callback: CallbackQuery):
+    await edit_screen(callback.message, GENERATOR_SCREEN)
+    await callback.answer()
 
-    text = f"""
+def render_gen_power(gen_data: GeneratorData) -> Screen:
+    return Screen(f"""
 🔋 <b>ПАРАМЕТРЫ МОЩНОСТИ</b>
 
 ⚡ Выходная мощность: <b>{gen_data.power_output:.1f} МВт</b>
@@ -253,33 +464,31 @@ async def callback_gen_power(callback: CallbackQuery):
 💡 Эффективность: <b>{gen_data.efficiency:.1f}%</b>
 
 <i>Генератор работает в штатном режиме</i>
-    """
+    """, GENERATOR_KEYBOARD)
 
-    await callback.message.edit_text(text, reply_markup=get_generator_keyboard())
+@router.callback_query.data("gen_power")
+async def callback_gen_power(callback: CallbackQuery, session: AsyncSession):
+    await edit_screen(callback.message, screen_cache.get("gen_power", render_gen_power, await get_generator_data(session)))
     await callback.answer()
 
-@router.callback_query(F.data == "gen_temp")
-async def callback_gen_temp(callback: CallbackQuery):
-    gen_data = await get_generator_data()
-
-    text = f"""
+def render_gen_temp(gen_data: GeneratorData) -> Screen:
+    return Screen(f"""
 🌡️ <b>ТЕМПЕРАТУРНЫЕ ПАРАМЕТРЫ</b>
 
 🌡️ Основная температура: <b>{gen_data.temperature:.1f}°C</b>
-📈 Допустимая: <b>120.0°C</b>
-⚠️ Критическая: <b>150.0°C</b>
+📈 Допустимая: <b>{TEMPERATURE.warning:.1f}°C</b>
+⚠️ Критическая: <b>{TEMPERATURE.critical:.1f}°C</b>
 
 ✅ <i>Температурный режим в норме</i>
-    """
+    """, GENERATOR_KEYBOARD)
 
-    await callback.message.edit_text(text, reply_markup=get_generator_keyboard())
+@router.callback_query.data("gen_temp")
+async def callback_gen_temp(callback: CallbackQuery, session: AsyncSession):
+    await edit_screen(callback.message, screen_cache.get("gen_temp", render_gen_temp, await get_generator_data(session)))
     await callback.answer()
 
-@router.callback_query(F.data == "gen_cooling")
-async def callback_gen_cooling(callback: CallbackQuery):
-    gen_data = await get_generator_data()
-
-    text = f"""
+def render_gen_cooling(gen_data: GeneratorData) -> Screen:
+    return Screen(f"""
 💨 <b>СИСТЕМА ОХЛАЖДЕНИЯ</b>
 
 💧 Поток охлаждающей жидкости: <b>{gen_data.coolant_flow:.1f} л/мин</b>
@@ -287,16 +496,15 @@ async def callback_gen_cooling(callback: CallbackQuery):
 🔵 Уровень хладагента: <b>92%</b>
 
 ✅ <i>Система охлаждения функционирует нормально</i>
-    """
+    """, GENERATOR_KEYBOARD)
 
-    await callback.message.edit_text(text, reply_markup=get_generator_keyboard())
+@router.callback_query.data("gen_cooling")
+async def callback_gen_cooling(callback: CallbackQuery, session: AsyncSession):
+    await edit_screen(callback.message, screen_cache.get("gen_cooling", render_gen_cooling, await get_generator_data(session)))
     await callback.answer()
 
-@router.callback_query(F.data == "gen_turbine")
-async def callback_gen_turbine(callback: CallbackQuery):
-    gen_data = await get_generator_data()
-
-    text = f"""
+def render_gen_turbine(gen_data: GeneratorData) -> Screen:
+    return Screen(f"""
 ⚙️ <b>ТУРБИННЫЙ МОДУЛЬ</b>
 
 🔄 Обороты: <b>{gen_data.turbine_rpm:.0f} об/мин</b>
@@ -304,14 +512,15 @@ async def callback_gen_turbine(callback: CallbackQuery):
 🔋 Топливо: <b>{gen_data.fuel_level:.1f}%</b>
 
 ✅ <i>Турбина работает стабильно</i>
-    """
+    """, GENERATOR_KEYBOARD)
 
-    await callback.message.edit_text(text, reply_markup=get_generator_keyboard())
+@router.callback_query.data("gen_turbine")
+async def callback_gen_turbine(callback: CallbackQuery, session: AsyncSession):
+    await edit_screen(callback.message, screen_cache.get("gen_turbine", render_gen_turbine, await get_generator_data(session)))
     await callback.answer()
 
-@router.callback_query(F.data == "diagnostics")
-async def callback_diagnostics(callback: CallbackQuery):
-    text = f"""
+# the checks run once, when the bot starts
+DIAGNOSTICS_SCREEN = Screen(f"""
 🔧 <b>ДИАГНОСТИЧЕСКАЯ СИСТЕМА</b>
 
 ✅ Все системы функционируют нормально
@@ -328,16 +537,15 @@ async def callback_diagnostics(callback: CallbackQuery):
 ⚠️ <b>ПРЕДУПРЕЖДЕНИЕ:</b> Обнаружена нестабильность в подсистеме синхронизации между генераторами. 
 
 <i>Для подробной информации просмотрите логи на сервере.</i>
-    """
+    """, MAIN_KEYBOARD)
 
-    await callback.message.edit_text(text, reply_markup=get_main_keyboard())
+@router.callback_query.data("diagnostics")
+async def callback_diagnostics(callback: CallbackQuery):
+    await edit_screen(callback.message, DIAGNOSTICS_SCREEN)
     await callback.answer()
 
-@router.callback_query(F.data == "monitoring")
-async def callback_monitoring(callback: CallbackQuery):
-    gen_data = await get_generator_data()
-
-    text = f"""
+def render_monitoring(gen_data: GeneratorData) -> str:
+    return f"""
 📈 <b>МОНИТОРИНГ В РЕАЛЬНОМ ВРЕМЕНИ</b>
 
 📊 <b>Текущие показатели:</b>
@@ -347,19 +555,113 @@ async def callback_monitoring(callback: CallbackQuery):
 💨 Давление: {gen_data.pressure:.1f} кПа
 ⚙️ Турбина: {gen_data.turbine_rpm:.0f} об/мин
 🔋 Топливо: {gen_data.fuel_level:.1f}%
-
+{render_trends()}
 🕐 Время работы: 127 дней 14 часов
 🔌 Генерация энергии: <b>АКТИВНА</b>
 
 <i>Система функционирует в штатном режиме</i>
     """
 
-    await callback.message.edit_text(text, reply_markup=get_main_keyboard())
+TREND_METRICS = (
+    ("⚡", "power_output", "{:.0f}"),
+    ("🌡️", "temperature", "{:.1f}"),
+    ("💨", "pressure", "{:.1f}"),
+    ("⚙️", "turbine_rpm", "{:.0f}"),
+    ("🔋", "fuel_level", "{:.1f}"),
+)
+
+def render_trends() -> str:
+    lines = []
+    for icon, metric, number in TREND_METRICS:
+        summary = trend_history.summary(metric)
+        if summary is None:
+            continue
+        low, average, high, spark = summary
+        lines.append(f"{icon} <code>{spark}</code> {number.format(low)} / {number.format(average)} / {number.format(high)}")
+    if not lines:
+        return ""
+    return f"\n📉 <b>Тренд за {TREND_WINDOW / 3600:g} ч</b> (мин / сред / макс):\n" + "\n".join(lines) + "\n"
+
+def render_live_monitoring(gen_data: GeneratorData):
+    # stamped with the data time, not the wall clock, so unchanged data renders identical text
+    text = f"🔴 <b>LIVE</b> · {gen_data.updated_at.strftime('%H:%M:%S')}\n{render_monitoring(gen_data)}"
+    return text, LIVE_KEYBOARD
+
+@router.callback_query.data("monitoring")
+async def callback_monitoring(callback: CallbackQuery, session: AsyncSession):
+    gen_data = await get_generator_data(session)
+    screen = screen_cache.get(
+        "monitoring", lambda gen_data: Screen(render_monitoring(gen_data), MONITORING_KEYBOARD), gen_data, trend_history.version
+    )
+    await edit_screen(callback.message, screen)
+    await callback.answer()
+
+@router.callback_query.data("monitoring_live")
+async def callback_monitoring_live(callback: CallbackQuery, session: AsyncSession):
+    gen_data = await get_generator_data(session)
+    text, markup = render_live_monitoring(gen_data)
+    # a message of its own, so browsing the menu does not fight with the live edits
+    message = await callback.message.answer(text, reply_markup=markup)
+    await live_monitor.subscribe(session, message.chat.id, message.message_id, text)
+    await callback.answer()
+
+@router.callback_query.data("monitoring_stop")
+async def callback_monitoring_stop(callback: CallbackQuery, session: AsyncSession):
+    await live_monitor.unsubscribe(session, callback.message.chat.id, callback.message.message_id)
+    gen_data = await get_generator_data(session)
+    screen = screen_cache.get(
+        "monitoring_stopped", lambda gen_data: Screen(render_monitoring(gen_data)), gen_data, trend_history.version
+    )
+    await edit_screen(callback.message, screen)
+    await callback.answer()
+
+async def send_chart(message: Message, name: str, hours: float) -> None:
+    icon, metric, label, unit = CHART_METRICS[name]
+    window = hours * 3600
+    chart = await chart_renderer.get(metric, window)
+    if chart is None:
+        await message.answer("📉 Недостаточно данных для графика, попробуйте позже.")
+        return
+    low, average, high, _ = trend_history.summary(metric, window)
+    caption = (
+        f"{icon} <b>{label}</b> за {hours:g} ч\n"
+        f"мин {low:.1f} · сред {average:.1f} · макс {high:.1f} {unit}"
+    )
+    if chart.file_id is not None:
+        try:
+            await message.answer_photo(chart.file_id, caption=caption)
+            return
+        except TelegramBadRequest:
+            chart.file_id = None
+    sent = await message.answer_photo(BufferedInputFile(chart.png, filename=f"{metric}.png"), caption=caption)
+    # the largest size is the original upload
+    chart.file_id = sent.photo[-1].file_id
+
+@router.message(Command("chart"))
+async def cmd_chart(message: Message, command: CommandObject):
+    args = (command.args or "").split()
+    name = args[0].lower() if args else "power"
+    try:
+        hours = float(args[1]) if len(args) > 1 else TREND_WINDOW / 3600
+    except ValueError:
+        hours = 0
+    if name not in CHART_METRICS or not 0 < hours <= TREND_WINDOW / 3600:
+        await message.answer(
+            f"📉 /chart [{'|'.join(CHART_METRICS)}] [часы, до {TREND_WINDOW / 3600:g}]\n\n"
+            "Например: /chart temperature 6"
+        )
+        return
+    await send_chart(message, name, hours)
+
+@router.callback_query.data(ChartCallback)
+async def callback_chart(callback: CallbackQuery, callback_data: ChartCallback):
+    if callback_data.metric in CHART_METRICS and 0 < callback_data.hours <= TREND_WINDOW / 3600:
+        await send_chart(callback.message, callback_data.metric, callback_data.hours)
     await callback.answer()
 
-@router.callback_query(F.data == "settings")
-async def callback_settings(callback: CallbackQuery):
-    user = await get_or_create_user(callback.from_user.id, callback.from_user.username)
+@router.callback_query.data("settings")
+async def callback_settings(callback: CallbackQuery, session: AsyncSession):
+    user = await get_or_create_user(session, callback.from_user.id, callback.from_user.username)
 
     text = f"""
 ⚙️ <b>НАСТРОЙКИ СИСТЕМЫ</b>
@@ -372,19 +674,27 @@ async def callback_settings(callback: CallbackQuery):
 
 <b>Доступные команды:</b>
 /status — показать статус системы
+/alerts — оповещения о превышении порогов
+/chart — график показателя
     """
 
-    await callback.message.edit_text(text, reply_markup=get_main_keyboard(), disable_web_page_preview=True)
+    await edit_screen(callback.message, Screen(text, MAIN_KEYBOARD), disable_web_page_preview=True)
     await callback.answer()
 
-@router.callback_query(F.data == "back_main")
-async def callback_back_main(callback: CallbackQuery):
-    text = """
+MAIN_MENU_SCREEN = Screen("""
 🔋 <b>СИСТЕМА УПРАВЛЕНИЯ ГЕНЕРАТОРОМ №1</b>
 
 Выберите раздел для просмотра:
-    """
-    await callback.message.edit_text(text, reply_markup=get_main_keyboard())
+    """, MAIN_KEYBOARD)
+
+@router.callback_query.data("back_main")
+async def callback_back_main(callback: CallbackQuery):
+    await edit_screen(callback.message, MAIN_MENU_SCREEN)
+    await callback.answer()
+
+@router.callback_query()
+async def callback_unknown(callback: CallbackQuery):
+    # buttons of an older layout; answered so the client stops its spinner
     await callback.answer()
 
 @router.message()
@@ -394,42 +704,229 @@ async def unknown_command(message: Message):
         "Используйте /start для отображения главного меню."
     )
 
+async def set_webhook(bot: Bot) -> None:
+    await bot.set_webhook(f"{BASE_WEBHOOK_URL}{WEBHOOK_PATH}", secret_token=WEBHOOK_SECRET)
+    logger.info(f"Webhook set to {BASE_WEBHOOK_URL}{WEBHOOK_PATH}")
+
+async def backfill_trends() -> None:
+    try:
+        async with async_session_maker() as session:
+            loaded = await trend_history.backfill(session)
+        logger.info(f"Loaded {loaded} trend samples")
+    except Exception as e:
+        logger.warning(f"Trend backfill failed: {e}")
+
 async def on_startup(bot: Bot) -> None:
     await init_db()
-    await bot.set_webhook(f"{BASE_WEBHOOK_URL}{WEBHOOK_PATH}")
-    logger.info(f"Webhook set to {BASE_WEBHOOK_URL}{WEBHOOK_PATH}")
+    await warm_pool(engine)
+    # before the listener, so older history is not rejected behind a fresh snapshot
+    await backfill_trends()
+    await listener.start()
+    await alert_engine.start(bot)
+    await live_monitor.start(bot)
+    await set_webhook(bot)
+
+async def on_worker_startup(bot: Bot) -> None:
+    await warm_pool(engine)
+    await backfill_trends()
+    await listener.start()
+    await alert_engine.start(bot)
+    await live_monitor.start(bot)
+
+async def on_shutdown(bot: Bot) -> None:
+    chart_renderer.stop()
+    await live_monitor.stop()
+    await alert_engine.stop()
+    await listener.stop()
+
+async def stats_handler(request: web.Request) -> web.Response:
+    stats = {
+        "db_pool": engine.pool.stats(),
+        "request_log": request_log_writer.stats(),
+        "generator_cache": generator_cache.stats(),
+        "user_cache": user_cache.stats(),
+        "outbound": request.app["outbound_limiter"].stats(),
+        "alerts": alert_engine.stats(),
+        "live_monitor": live_monitor.stats(),
+        "trends": trend_history.stats(),
+        "charts": chart_renderer.stats(),
+        "screens": screen_cache.stats(),
+    }
+    if isinstance(storage, PostgresStorage):
+        stats["fsm_storage"] = storage.stats()
+    if update_dedup is not None:
+        stats["update_dedup"] = update_dedup.stats()
+    webhook_requests_handler = request.app["webhook_requests_handler"]
+    if isinstance(webhook_requests_handler, QueuedRequestHandler):
+        stats["webhook_queue"] = webhook_requests_handler.stats()
+    return web.json_response(stats, dumps=JSON_CODEC.dumps)
+
+async def start_request_log(app: web.Application) -> None:
+    request_log_writer.start()
+
+async def stop_request_log(app: web.Application) -> None:
+    request_log_writer.stop()
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    """Prometheus text format of this process's registry.
+
+    With WEB_WORKERS > 1 every worker keeps its own registry and SO_REUSEPORT hands each
+    scrape to one of them, so a scrape sees that worker only; counters from different
+    scrapes may come from different workers.
+    """
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+def create_internal_app(app: web.Application) -> None:
+    """Serves /stats and /metrics of this process on INTERNAL_PORT, next to the public app."""
+    internal_app = web.Application()
+    internal_app["webhook_requests_handler"] = app["webhook_requests_handler"]
+    internal_app["outbound_limiter"] = app["outbound_limiter"]
+    internal_app.router.add_get(STATS_PATH, stats_handler)
+    internal_app.router.add_get(METRICS_PATH, metrics_handler)
+    runner = web.AppRunner(internal_app, access_log=None)
+
+    async def start_internal_app(app: web.Application) -> None:
+        await runner.setup()
+        # pre-fork workers bind the same port, as they do for the webhook
+        await web.TCPSite(runner, INTERNAL_HOST, INTERNAL_PORT, reuse_port=WEB_WORKERS > 1).start()
+
+    async def stop_internal_app(app: web.Application) -> None:
+        await runner.cleanup()
+
+    app.on_startup.append(start_internal_app)
+    app.on_cleanup.append(stop_internal_app)
 
 @web.middleware
-async def logger_middleware(request: web.Request, handler: Callable[[web.Request], Awaitable[web.StreamResponse]]):
-    body = await request.text()
-    logger.info("WEBHOOK REQUEST %s %s", request.method, request.path_qs)
-    logger.info("Headers: %s", dict(request.headers))
-    logger.info("Body: %s", body.replace("\n", ""))
-    return await handler(request)
+async def in_flight_middleware(request: web.Request, handler: Callable[[web.Request], Awaitable[web.StreamResponse]]):
+    http_in_flight.inc()
+    try:
+        return await handler(request)
+    finally:
+        http_in_flight.dec()
+
+def create_bot() -> Bot:
+    session = TunedAiohttpSession(
+        api=TelegramAPIServer.from_base(TELEGRAM_BOT_API_URL),
+        limit=TELEGRAM_API_CONNECTIONS,
+        keepalive_timeout=TELEGRAM_API_KEEPALIVE,
+        dns_cache_ttl=TELEGRAM_API_DNS_TTL,
+        unix_socket=TELEGRAM_API_SOCKET,
+        method_timeouts=TELEGRAM_API_TIMEOUTS,
+        retries=TELEGRAM_API_RETRIES,
+        json_loads=JSON_CODEC.loads,
+        json_dumps=JSON_CODEC.dumps,
+    )
 
-def main() -> None:
+    return Bot(token=TOKEN, session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+
+def create_app(worker: bool = False) -> web.Application:
     dp = Dispatcher(storage=storage)
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    dp.update.outer_middleware(DbSessionMiddleware(async_session_maker))
     dp.include_router(router)
-    dp.startup.register(on_startup)
-
-    session = AiohttpSession(
-        api=TelegramAPIServer.from_base(TELEGRAM_BOT_API_URL)
+    dp.startup.register(on_worker_startup if worker else on_startup)
+    dp.shutdown.register(on_shutdown)
+
+    bot = create_bot()
+    outbound_limiter = OutboundRateLimiter(
+        global_rate=OUTBOUND_GLOBAL_RATE,
+        chat_rate=OUTBOUND_CHAT_RATE,
+        chat_burst=OUTBOUND_CHAT_BURST,
+        # a handler paced for seconds must not pin a pool connection meanwhile
+        before_wait=release_current_session,
     )
-
-    bot = Bot(token=TOKEN, session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    # registered first, so the latency middleware below it times only the HTTP call
+    bot.session.middleware(outbound_limiter)
+    bot.session.middleware(ApiTimingMiddleware())
 
     app = web.Application(logger=logging.getLogger())
-    app.middlewares.append(logger_middleware)
-
-    webhook_requests_handler = SimpleRequestHandler(
-        dispatcher=dp,
-        bot=bot,
-    )
+    app.middlewares.append(create_webhook_guard_middleware(
+        WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        allowed_networks=WEBHOOK_ALLOWED_IPS,
+    ))
+    app.middlewares.append(create_internal_guard_middleware((STATS_PATH, METRICS_PATH), INTERNAL_ALLOWED_IPS))
+    app.middlewares.append(in_flight_middleware)
+    app.middlewares.append(create_request_log_middleware(
+        request_log_writer,
+        sample_rates=REQUEST_LOG_SAMPLE_RATES,
+        default_rate=REQUEST_LOG_DEFAULT_RATE,
+        max_body=REQUEST_LOG_MAX_BODY,
+    ))
+    app.on_startup.append(start_request_log)
+    app.on_cleanup.append(stop_request_log)
+
+    if WEBHOOK_WORKERS > 0:
+        webhook_requests_handler = QueuedRequestHandler(
+            dispatcher=dp,
+            bot=bot,
+            workers=WEBHOOK_WORKERS,
+            queue_size=WEBHOOK_QUEUE_SIZE,
+            backpressure=WEBHOOK_BACKPRESSURE,
+            dedup=update_dedup,
+        )
+        registry.gauge("bot_webhook_queue_depth", "Updates waiting in the lane scheduler", function=webhook_requests_handler.scheduler.depth)
+    else:
+        webhook_requests_handler = DedupRequestHandler(
+            dispatcher=dp,
+            bot=bot,
+            dedup=update_dedup,
+        )
     webhook_requests_handler.register(app, path=WEBHOOK_PATH)
+    app["webhook_requests_handler"] = webhook_requests_handler
+    app["outbound_limiter"] = outbound_limiter
+    if INTERNAL_PORT:
+        create_internal_app(app)
+    else:
+        app.router.add_get(STATS_PATH, stats_handler)
+        app.router.add_get(METRICS_PATH, metrics_handler)
 
     setup_application(app, dp, bot=bot)
+    return app
+
+async def prepare_workers() -> None:
+    await init_db()
+    bot = create_bot()
+    try:
+        await set_webhook(bot)
+    finally:
+        await bot.session.close()
+    await engine.dispose()
+
+def run_worker() -> None:
+    # spawned, not forked: the worker re-imports this module and gets its own engine and pool
+    web.run_app(create_app(worker=True), host=WEBHOOK_HOST, port=WEBHOOK_PORT, reuse_port=True)
+
+def run_workers() -> None:
+    asyncio.run(prepare_workers())
+
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=run_worker, name=f"bot-worker-{i}") for i in range(WEB_WORKERS)]
+    for worker in workers:
+        worker.start()
+    logger.info(f"Started {WEB_WORKERS} workers on port {WEBHOOK_PORT}")
+
+    def stop_workers(signum, frame):
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+
+    signal.signal(signal.SIGTERM, stop_workers)
+    signal.signal(signal.SIGINT, stop_workers)
+
+    # if one worker dies, take the rest down too and let the container restart
+    multiprocessing.connection.wait([worker.sentinel for worker in workers])
+    stop_workers(None, None)
+    for worker in workers:
+        worker.join()
+    sys.exit(max(abs(worker.exitcode or 0) for worker in workers))
+
+def main() -> None:
+    if WEB_WORKERS > 1:
+        run_workers()
+        return
 
-    web.run_app(app, host=WEBHOOK_HOST, port=WEBHOOK_PORT)
+    web.run_app(create_app(), host=WEBHOOK_HOST, port=WEBHOOK_PORT)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,139 @@
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select
+from db.models import GeneratorData, User
+
+class GeneratorSnapshotCache:
+    """Row of one generator, invalidated by NOTIFY and expired by TTL when the listener is down."""
+
+    def __init__(self, session_maker, listener, ttl: float = 60.0, fallback_ttl: float = 5.0, generator_id: int = 1):
+        self.session_maker = session_maker
+        self.listener = listener
+        self.generator_id = generator_id
+        self.ttl = ttl
+        self.fallback_ttl = fallback_ttl
+        self.hits = 0
+        self.misses = 0
+        self._snapshot = None
+        self._expires_at = 0.0
+        self._generation = 0
+        self._lock = asyncio.Lock()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+    def invalidate(self, payload: str = None):
+        self._generation += 1
+        self._expires_at = 0.0
+
+    def put(self, snapshot: GeneratorData):
+        # a snapshot published with the change is as fresh as a SELECT right after it
+        self._generation += 1
+        self._snapshot = snapshot
+        self._expires_at = time.monotonic() + (self.ttl if self.listener.connected else self.fallback_ttl)
+
+    def _is_fresh(self) -> bool:
+        return self._snapshot is not None and time.monotonic() < self._expires_at
+
+    async def _load(self, session) -> GeneratorData:
+        result = await session.execute(select(GeneratorData).where(GeneratorData.id == self.generator_id))
+        return result.scalar_one_or_none()
+
+    async def get(self, session=None) -> GeneratorData:
+        if self._is_fresh():
+            self.hits += 1
+            return self._snapshot
+        async with self._lock:
+            if self._is_fresh():
+                self.hits += 1
+                return self._snapshot
+            self.misses += 1
+            ttl = self.ttl if self.listener.connected else self.fallback_ttl
+            generation = self._generation
+            if session is not None:
+                snapshot = await self._load(session)
+            else:
+                async with self.session_maker() as own_session:
+                    snapshot = await self._load(own_session)
+            # a NOTIFY that raced the SELECT leaves the snapshot expired, and a put() wins over it
+            if generation == self._generation:
+                self._snapshot = snapshot
+                self._expires_at = time.monotonic() + ttl
+            elif self._snapshot is None:
+                self._snapshot = snapshot
+            return snapshot
+
+@dataclass(frozen=True)
+class CachedUser:
+    """Plain copy of a committed User row; unlike the ORM instance it outlives its session."""
+    id: int
+    telegram_id: int
+    username: Optional[str]
+    is_admin: bool
+    registered_at: Optional[datetime]
+
+    @classmethod
+    def from_row(cls, user: User) -> "CachedUser":
+        return cls(
+            id=user.id,
+            telegram_id=user.telegram_id,
+            username=user.username,
+            is_admin=bool(user.is_admin),
+            registered_at=user.registered_at,
+        )
+
+class UserCache:
+    """Bounded LRU of CachedUser snapshots keyed by telegram_id, each living at most ttl seconds.
+
+    Only put rows that are already committed: a snapshot of a rolled-back insert would
+    outlive the transaction.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def get(self, telegram_id: int) -> Optional[CachedUser]:
+        entry = self._entries.get(telegram_id)
+        if entry is not None and entry[1] < time.monotonic():
+            del self._entries[telegram_id]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(telegram_id)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, user: CachedUser):
+        if self.maxsize <= 0:
+            return
+        self._entries[user.telegram_id] = (user, time.monotonic() + self.ttl)
+        self._entries.move_to_end(user.telegram_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, telegram_id):
+        self._entries.pop(int(telegram_id), None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
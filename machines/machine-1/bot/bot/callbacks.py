@@ -0,0 +1,86 @@
+from typing import Any, Dict, Optional, Set, Tuple, Type, Union
+
+from aiogram import Router
+from aiogram.dispatcher.event.bases import SkipHandler
+from aiogram.dispatcher.event.handler import CallbackType, FilterObject, HandlerObject
+from aiogram.dispatcher.event.telegram import TelegramEventObserver
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import TelegramObject
+
+class ChartCallback(CallbackData, prefix="chart"):
+    metric: str
+    hours: int
+
+class CallbackQueryTable(TelegramEventObserver):
+    """callback_query observer that finds its handler with one dict lookup.
+
+    Handlers registered with data() are indexed by their exact callback_data, or by
+    the prefix of a CallbackData factory, which is unpacked into callback_data. Handlers
+    registered the usual way are still scanned in order once the table has no match.
+    Dispatcher.resolve_used_update_types only sees the scanned ones, so keep at least
+    one of those if allowed_updates are derived from the handlers.
+    """
+
+    def __init__(self, router: Router, event_name: str = "callback_query"):
+        super().__init__(router, event_name)
+        self.exact: Dict[str, HandlerObject] = {}
+        self.factories: Dict[str, Tuple[Type[CallbackData], HandlerObject]] = {}
+        self._separators: Set[str] = set()
+
+    def data(self, key: Union[str, Type[CallbackData]], *filters: CallbackType, flags: Optional[Dict[str, Any]] = None):
+        def wrapper(callback: CallbackType) -> CallbackType:
+            handler = HandlerObject(callback=callback, filters=[FilterObject(item) for item in filters], flags=flags or {})
+            if isinstance(key, str):
+                if key in self.exact:
+                    raise ValueError(f"callback_data {key!r} already has a handler")
+                self.exact[key] = handler
+            else:
+                if key.__prefix__ in self.factories:
+                    raise ValueError(f"callback_data prefix {key.__prefix__!r} already has a handler")
+                self.factories[key.__prefix__] = (key, handler)
+                self._separators.add(key.__separator__)
+            return callback
+
+        return wrapper
+
+    def lookup(self, data: Optional[str]) -> Tuple[Optional[HandlerObject], Optional[CallbackData]]:
+        if data is None:
+            return None, None
+        handler = self.exact.get(data)
+        if handler is not None:
+            return handler, None
+        for separator in self._separators:
+            entry = self.factories.get(data.split(separator, 1)[0])
+            if entry is None:
+                continue
+            factory, handler = entry
+            try:
+                return handler, factory.unpack(data)
+            except (TypeError, ValueError):
+                # a button of an older layout; let the scanned handlers see it
+                return None, None
+        return None, None
+
+    async def trigger(self, event: TelegramObject, **kwargs: Any) -> Any:
+        handler, callback_data = self.lookup(getattr(event, "data", None))
+        if handler is not None:
+            scoped = {**kwargs, "handler": handler}
+            if callback_data is not None:
+                scoped["callback_data"] = callback_data
+            result, data = await handler.check(event, **scoped)
+            if result:
+                scoped.update(data)
+                try:
+                    wrapped_inner = self.outer_middleware.wrap_middlewares(self._resolve_middlewares(), handler.call)
+                    return await wrapped_inner(event, scoped)
+                except SkipHandler:
+                    pass
+        return await super().trigger(event, **kwargs)
+
+class IndexedRouter(Router):
+    """Router whose callback_query observer is a CallbackQueryTable."""
+
+    def __init__(self, *, name: Optional[str] = None):
+        super().__init__(name=name)
+        self.callback_query = CallbackQueryTable(router=self)
+        self.observers["callback_query"] = self.callback_query
@@ -0,0 +1,71 @@
+# Runs in the chart worker processes: standard library only, and nothing from the bot,
+# so a worker imports this module and no other.
+import struct
+import zlib
+from typing import Sequence, Tuple
+
+BACKGROUND = (24, 26, 33)
+GRID = (52, 56, 68)
+LINE = (255, 176, 32)
+FILL = (92, 70, 38)
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+def encode_png(width: int, height: int, pixels: bytearray) -> bytes:
+    stride = width * 3
+    # filter type 0 in front of every scanline
+    raw = b"".join(b"\x00" + pixels[row * stride:(row + 1) * stride] for row in range(height))
+    return b"".join((
+        b"\x89PNG\r\n\x1a\n",
+        _png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)),
+        _png_chunk(b"IDAT", zlib.compress(raw, 6)),
+        _png_chunk(b"IEND", b""),
+    ))
+
+def render_chart(times: Sequence[float], values: Sequence[float], width: int = 800, height: int = 400) -> bytes:
+    """Area chart of one series as PNG bytes; plain Python so it runs in any worker process."""
+    margin = 16
+    left, right, top, bottom = margin, width - margin, margin, height - margin
+    pixels = bytearray(bytes(BACKGROUND) * (width * height))
+
+    def fill_row(y: int, x0: int, x1: int, color: Tuple[int, int, int]) -> None:
+        start = (y * width + x0) * 3
+        pixels[start:start + (x1 - x0) * 3] = bytes(color) * (x1 - x0)
+
+    for step in range(5):
+        fill_row(top + (bottom - top) * step // 4, left, right, GRID)
+    for step in range(7):
+        x = left + (right - left - 1) * step // 6
+        for y in range(top, bottom):
+            pixels[(y * width + x) * 3:(y * width + x) * 3 + 3] = bytes(GRID)
+
+    low, high = min(values), max(values)
+    pad = (high - low) * 0.05 or 1.0
+    low, high = low - pad, high + pad
+    t0, t1 = times[0], times[-1]
+    span = (t1 - t0) or 1.0
+
+    # one y per pixel column, interpolated between the samples around it
+    columns = []
+    index = 0
+    for x in range(left, right):
+        moment = t0 + span * (x - left) / (right - left - 1)
+        while index < len(times) - 2 and times[index + 1] < moment:
+            index += 1
+        ta, tb = times[index], times[min(index + 1, len(times) - 1)]
+        va, vb = values[index], values[min(index + 1, len(values) - 1)]
+        value = va if tb == ta else va + (vb - va) * min(1.0, max(0.0, (moment - ta) / (tb - ta)))
+        columns.append(bottom - 1 - round((value - low) / (high - low) * (bottom - top - 1)))
+
+    fill, line = bytes(FILL), bytes(LINE)
+    previous = columns[0]
+    for offset, y in enumerate(columns):
+        x = left + offset
+        for row in range(y + 2, bottom):
+            pixels[(row * width + x) * 3:(row * width + x) * 3 + 3] = fill
+        # join to the previous column so steep changes stay connected, two pixels thick
+        for row in range(max(top, min(previous, y) - 1), min(bottom, max(previous, y) + 2)):
+            pixels[(row * width + x) * 3:(row * width + x) * 3 + 3] = line
+        previous = y
+    return encode_png(width, height, pixels)
@@ -0,0 +1,108 @@
+import asyncio
+import multiprocessing
+import sys
+import time
+import types
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from chart_render import render_chart
+from metrics import registry
+
+chart_requests = registry.counter("bot_chart_requests_total", "Chart requests by how they were served", ("result",))
+chart_render_latency = registry.histogram(
+    "bot_chart_render_seconds", "Time to render a chart PNG in the process pool",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+@contextmanager
+def _without_main_script():
+    """Keeps multiprocessing from re-running the bot's main script in a new chart worker.
+
+    A spawned child runs the parent's __main__ file before it unpickles anything, which
+    for bot.py means an engine, a listener and the routers per worker. With a bare
+    __main__ in place while the pool starts a process, the worker imports chart_render
+    for render_chart and nothing else.
+    """
+    main = sys.modules["__main__"]
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main
+
+@dataclass
+class RenderedChart:
+    png: bytes
+    # set once Telegram has the image, so repeats are sent by reference
+    file_id: Optional[str] = None
+
+class ChartRenderer:
+    """Renders trend charts in a process pool and keeps the results by (metric, window, data version)."""
+
+    def __init__(self, history, workers: int = 2, cache_size: int = 64, width: int = 800, height: int = 400):
+        self.history = history
+        self.workers = workers
+        self.cache_size = cache_size
+        self.width = width
+        self.height = height
+        self.renders = 0
+        self._cache: "OrderedDict[tuple, RenderedChart]" = OrderedDict()
+        self._pending: Dict[tuple, asyncio.Future] = {}
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def start(self) -> None:
+        if self._executor is None:
+            # spawned, not forked, like the webhook workers: the event loop and its threads stay behind
+            self._executor = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn"), initializer=None
+            )
+
+    def stop(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def get(self, metric: str, window: float) -> Optional[RenderedChart]:
+        key = (metric, window, self.history.version)
+        chart = self._cache.get(key)
+        if chart is not None:
+            self._cache.move_to_end(key)
+            chart_requests.inc("file_id" if chart.file_id else "cached")
+            return chart
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = asyncio.ensure_future(self._render(key))
+            pending.add_done_callback(lambda future: self._pending.pop(key, None))
+        else:
+            chart_requests.inc("joined")
+        # a caller that goes away does not cancel the render for the others
+        return await asyncio.shield(pending)
+
+    async def _render(self, key: tuple) -> Optional[RenderedChart]:
+        metric, window, _ = key
+        times, values = self.history.series(metric, window, self.width)
+        if len(values) < 2:
+            chart_requests.inc("empty")
+            return None
+        self.start()
+        started = time.perf_counter()
+        # the pool starts its processes on submit, which run_in_executor does right here
+        with _without_main_script():
+            future = asyncio.get_running_loop().run_in_executor(
+                self._executor, render_chart, times, values, self.width, self.height
+            )
+        png = await future
+        chart_render_latency.observe(time.perf_counter() - started)
+        chart_requests.inc("rendered")
+        self.renders += 1
+        chart = self._cache[key] = RenderedChart(png)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return chart
+
+    def stats(self) -> dict:
+        return {"cached": len(self._cache), "pending": len(self._pending), "renders": self.renders}
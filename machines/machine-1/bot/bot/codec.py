@@ -0,0 +1,38 @@
+import json
+import logging
+from typing import Any, Callable, Dict, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+class JsonCodec:
+    """loads takes str or bytes; dumps returns str, which is what aiogram and aiohttp expect."""
+
+    def __init__(self, name: str, loads: Callable[[Any], Any], dumps: Callable[..., str]):
+        self.name = name
+        self.loads = loads
+        self.dumps = dumps
+
+def _json_dumps(obj: Any, default: Optional[Callable[[Any], Any]] = None) -> str:
+    # UTF-8 as is: Cyrillic text escaped as \uXXXX is three times the size
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=default)
+
+def _orjson_dumps(obj: Any, default: Optional[Callable[[Any], Any]] = None) -> str:
+    # int keys become strings, as with json.dumps
+    return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+CODECS: Dict[str, JsonCodec] = {"json": JsonCodec("json", json.loads, _json_dumps)}
+if orjson is not None:
+    CODECS["orjson"] = JsonCodec("orjson", orjson.loads, _orjson_dumps)
+
+def get_codec(name: str = "auto") -> JsonCodec:
+    if name == "auto":
+        return CODECS.get("orjson", CODECS["json"])
+    if name not in CODECS:
+        logger.warning(f"JSON codec {name!r} is not available, using {', '.join(CODECS)}")
+        return CODECS.get("orjson", CODECS["json"])
+    return CODECS[name]
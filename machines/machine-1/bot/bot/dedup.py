@@ -0,0 +1,144 @@
+import logging
+from typing import List, Optional, Set
+
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert
+from db.models import ProcessedUpdate
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+updates_deduplicated = registry.counter(
+    "bot_webhook_updates_deduplicated_total", "Redelivered updates answered without being fed again", ("source",)
+)
+dedup_backend_errors = registry.counter(
+    "bot_webhook_dedup_backend_errors_total", "Shared dedup lookups that failed and let the update through"
+)
+
+class SharedUpdateLog:
+    """processed_updates as a dedup window shared by every process and replica.
+
+    The first INSERT of an update_id returns it; every later one hits the primary key
+    and returns nothing. Rows more than `window` ids behind the newest are pruned every
+    prune_every claims, which keeps the table at about the size of the local window.
+    """
+
+    def __init__(self, session_maker, window: int = 10000, prune_every: int = 1000):
+        self.session_maker = session_maker
+        self.window = window
+        self.prune_every = prune_every
+        self.claims = 0
+        self.pruned = 0
+
+    async def claim(self, update_id: int) -> bool:
+        async with self.session_maker() as session:
+            result = await session.execute(
+                insert(ProcessedUpdate)
+                .values(update_id=update_id)
+                .on_conflict_do_nothing(index_elements=[ProcessedUpdate.update_id])
+                .returning(ProcessedUpdate.update_id)
+            )
+            claimed = result.scalar_one_or_none() is not None
+            self.claims += 1
+            if claimed and self.claims % self.prune_every == 0:
+                # update_ids grow by one per update, so this is the same window the ring keeps
+                result = await session.execute(
+                    delete(ProcessedUpdate).where(ProcessedUpdate.update_id < update_id - self.window)
+                )
+                self.pruned += result.rowcount
+            await session.commit()
+        return claimed
+
+    async def release(self, update_id: int) -> None:
+        async with self.session_maker() as session:
+            await session.execute(delete(ProcessedUpdate).where(ProcessedUpdate.update_id == update_id))
+            await session.commit()
+
+    def stats(self) -> dict:
+        return {"claims": self.claims, "pruned": self.pruned}
+
+class UpdateDeduplicator:
+    """Remembers the last `size` update_ids in a ring buffer indexed by a set.
+
+    Memory stays fixed at `size` ids however long the bot runs: each new id overwrites
+    the oldest slot and leaves the set with it. With a shared log, an id this process
+    has not seen is claimed there too, so a redelivery that lands on another worker is
+    still caught. If the shared log fails, the update goes through; a double reply is
+    better than a lost one.
+    """
+
+    def __init__(self, size: int = 10000, shared: Optional[SharedUpdateLog] = None):
+        if size <= 0:
+            raise ValueError("size must be positive")
+        self.size = size
+        self.shared = shared
+        self._ring: List[Optional[int]] = [None] * size
+        self._seen: Set[int] = set()
+        self._next = 0
+        self.checked = 0
+        self.duplicates = 0
+        self.shared_duplicates = 0
+        self.released = 0
+
+    def _remember(self, update_id: int) -> None:
+        evicted = self._ring[self._next]
+        if evicted is not None:
+            self._seen.discard(evicted)
+        self._ring[self._next] = update_id
+        self._next = (self._next + 1) % self.size
+        self._seen.add(update_id)
+
+    async def first_seen(self, update_id: Optional[int]) -> bool:
+        """True the first time an update_id shows up, False for a redelivery."""
+        if update_id is None:
+            return True
+        self.checked += 1
+        if update_id in self._seen:
+            self.duplicates += 1
+            updates_deduplicated.inc("local")
+            return False
+        # remembered before the await, so a redelivery racing this one stops at the set
+        self._remember(update_id)
+        if self.shared is None:
+            return True
+        try:
+            claimed = await self.shared.claim(update_id)
+        except Exception:
+            logger.exception("Shared dedup lookup failed")
+            dedup_backend_errors.inc()
+            return True
+        if not claimed:
+            self.shared_duplicates += 1
+            updates_deduplicated.inc("shared")
+        return claimed
+
+    async def release(self, update_id: Optional[int]) -> None:
+        """Forgets an update whose handling failed, so that its redelivery is fed again.
+
+        Its ring slot is left to age out; if the id comes back before that, the slot
+        evicts it a little early.
+        """
+        if update_id is None or update_id not in self._seen:
+            return
+        self._seen.discard(update_id)
+        self.released += 1
+        if self.shared is not None:
+            try:
+                await self.shared.release(update_id)
+            except Exception:
+                logger.exception("Shared dedup release failed")
+                dedup_backend_errors.inc()
+
+    def stats(self) -> dict:
+        stats = {
+            "size": self.size,
+            "tracked": len(self._seen),
+            "checked": self.checked,
+            "duplicates": self.duplicates,
+            "shared_duplicates": self.shared_duplicates,
+            "released": self.released,
+        }
+        if self.shared is not None:
+            stats["shared"] = self.shared.stats()
+        return stats
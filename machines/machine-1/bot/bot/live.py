@@ -0,0 +1,159 @@
+import asyncio
+import hashlib
+import logging
+import time
+from datetime import timedelta
+from typing import Awaitable, Callable, Optional, Set, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from aiogram.types import InlineKeyboardMarkup
+
+from sqlalchemy import update, delete, func
+from sqlalchemy.dialects.postgresql import insert
+from db.models import LiveMonitor
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+live_ticks = registry.counter("bot_live_monitor_ticks_total", "Live monitoring renders")
+live_edits = registry.counter("bot_live_monitor_edits_total", "Live monitoring messages edited", ("result",))
+
+def text_digest(text: str) -> str:
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+class LiveMonitorBroadcaster:
+    """Keeps every live monitoring message up to date with the generator.
+
+    Each tick renders the text once for all chats. A single UPDATE then claims the
+    messages whose stored hash differs, so unchanged messages are skipped and, with several
+    workers, every message is edited by one process only. The edits are spaced across
+    the tick window instead of going out in one burst.
+    """
+
+    def __init__(
+        self,
+        session_maker,
+        snapshot: Callable[[], Awaitable],
+        render: Callable[[object], Tuple[str, InlineKeyboardMarkup]],
+        interval: float = 10.0,
+        ttl: float = 3600.0,
+    ):
+        self.session_maker = session_maker
+        self.snapshot = snapshot
+        self.render = render
+        self.interval = interval
+        self.ttl = ttl
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._edits: Set[asyncio.Task] = set()
+
+    def notify(self, payload: str = None) -> None:
+        self._wakeup.set()
+
+    async def start(self, bot: Bot) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(bot))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def subscribe(self, session, chat_id: int, message_id: int, text: str) -> None:
+        # one live message per chat; starting a new one retires the previous
+        stmt = insert(LiveMonitor).values(chat_id=chat_id, message_id=message_id, text_hash=text_digest(text))
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=[LiveMonitor.chat_id],
+            set_={"message_id": stmt.excluded.message_id, "text_hash": stmt.excluded.text_hash, "started_at": func.now()},
+        ))
+        await session.commit()
+
+    async def unsubscribe(self, session, chat_id: int, message_id: Optional[int] = None) -> None:
+        stmt = delete(LiveMonitor).where(LiveMonitor.chat_id == chat_id)
+        if message_id is not None:
+            stmt = stmt.where(LiveMonitor.message_id == message_id)
+        await session.execute(stmt)
+        await session.commit()
+
+    async def _run(self, bot: Bot) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            started = time.monotonic()
+            try:
+                await self.tick(bot)
+            except Exception as e:
+                logger.error(f"Live monitoring tick failed: {e}")
+            # changes arriving meanwhile are folded into the next tick
+            await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    async def tick(self, bot: Bot) -> int:
+        snapshot = await self.snapshot()
+        if snapshot is None:
+            return 0
+        text, markup = self.render(snapshot)
+        digest = text_digest(text)
+        live_ticks.inc()
+        async with self.session_maker() as session:
+            await session.execute(
+                delete(LiveMonitor).where(LiveMonitor.started_at < func.now() - timedelta(seconds=self.ttl))
+            )
+            result = await session.execute(
+                update(LiveMonitor)
+                .where(LiveMonitor.text_hash.is_distinct_from(digest))
+                .values(text_hash=digest)
+                .returning(LiveMonitor.chat_id, LiveMonitor.message_id)
+            )
+            targets = result.all()
+            await session.commit()
+        if not targets:
+            return 0
+
+        spacing = self.interval / len(targets)
+        start = time.monotonic()
+        for index, (chat_id, message_id) in enumerate(targets):
+            delay = start + index * spacing - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            task = asyncio.create_task(self._edit(bot, chat_id, message_id, text, markup))
+            self._edits.add(task)
+            task.add_done_callback(self._edits.discard)
+        await asyncio.gather(*self._edits)
+        return len(targets)
+
+    async def _edit(self, bot: Bot, chat_id: int, message_id: int, text: str, markup: InlineKeyboardMarkup) -> None:
+        try:
+            await bot.edit_message_text(text=text, chat_id=chat_id, message_id=message_id, reply_markup=markup)
+            live_edits.inc("ok")
+        except TelegramBadRequest as e:
+            if "not modified" in e.message:
+                live_edits.inc("unchanged")
+                return
+            # the message is gone or can no longer be edited
+            live_edits.inc("dropped")
+            async with self.session_maker() as session:
+                await self.unsubscribe(session, chat_id, message_id)
+        except TelegramForbiddenError:
+            live_edits.inc("dropped")
+            async with self.session_maker() as session:
+                await self.unsubscribe(session, chat_id)
+        except Exception as e:
+            live_edits.inc("failed")
+            logger.error(f"Failed to edit live monitoring message in {chat_id}: {e}")
+            # forget the hash so the next tick retries even if the text is unchanged
+            async with self.session_maker() as session:
+                await session.execute(
+                    update(LiveMonitor)
+                    .where(LiveMonitor.chat_id == chat_id, LiveMonitor.message_id == message_id)
+                    .values(text_hash=None)
+                )
+                await session.commit()
+
+    def stats(self) -> dict:
+        return {"ticks": int(live_ticks.value()), "editing": len(self._edits)}
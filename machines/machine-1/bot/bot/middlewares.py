@@ -0,0 +1,123 @@
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject, Update
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from metrics import api_call_latency, handler_latency, updates_total
+
+# the session of the update being handled, for code that only sees the Bot API call
+current_session: ContextVar[Optional[AsyncSession]] = ContextVar("current_session", default=None)
+
+WRITES_KEY = "has_writes"
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_statement_writes(orm_execute_state) -> None:
+    # text() counts as a write too; a SELECT with side effects (pg_notify) does not
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info[WRITES_KEY] = True
+
+@event.listens_for(Session, "after_flush")
+def _track_flush_writes(session, flush_context) -> None:
+    session.info[WRITES_KEY] = True
+
+@event.listens_for(Session, "after_transaction_end")
+def _reset_writes(session, transaction) -> None:
+    if transaction.parent is None:
+        session.info.pop(WRITES_KEY, None)
+
+def has_writes(session: AsyncSession) -> bool:
+    return bool(session.new or session.dirty or session.deleted or session.info.get(WRITES_KEY))
+
+async def release_current_session() -> None:
+    """Hands the update's connection back to the pool if its transaction has only read so far.
+
+    A read-only transaction is rolled back, which loses nothing; loaded rows are expunged
+    first so they keep their values. A transaction with writes is left alone, connection
+    included, for DbSessionMiddleware to commit.
+    """
+    session = current_session.get()
+    if session is None or not session.in_transaction() or has_writes(session):
+        return
+    session.expunge_all()
+    await session.rollback()
+
+class DbSessionMiddleware(BaseMiddleware):
+    """Opens one AsyncSession per update and commits it once the handler returns.
+
+    That commit is the only one the handler gets for free: nothing else commits its
+    writes. While the handler waits for an outbound rate-limit slot, a transaction that
+    has only read is rolled back to free its connection (release_current_session), but
+    one with writes keeps the connection for the whole wait. Handlers that write and
+    then send, like /promote and /alerts, commit before they send.
+    """
+
+    def __init__(self, session_maker):
+        self.session_maker = session_maker
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        # the session checks a connection out lazily, so updates that never
+        # touch the database never touch the pool either
+        async with self.session_maker() as session:
+            data["session"] = session
+            token = current_session.set(session)
+            try:
+                result = await handler(event, data)
+            finally:
+                current_session.reset(token)
+            if session.in_transaction():
+                await session.commit()
+            return result
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        updates_total.inc(event.event_type)
+        return await handler(event, data)
+
+class HandlerTimingMiddleware(BaseMiddleware):
+    """Inner middleware: only runs once a handler matched, so data["handler"] names it."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            handler_latency.observe(time.perf_counter() - start, data["handler"].callback.__name__)
+
+class ApiTimingMiddleware(BaseRequestMiddleware):
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ):
+        start = time.perf_counter()
+        status = "error"
+        try:
+            response = await make_request(bot, method)
+            status = "ok"
+            return response
+        finally:
+            api_call_latency.observe(time.perf_counter() - start, method.__api_method__, status)
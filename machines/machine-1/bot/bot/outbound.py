@@ -0,0 +1,183 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from metrics import registry
+
+RATE_LIMITED_METHODS = {
+    "sendMessage",
+    "sendPhoto",
+    "sendDocument",
+    "sendMediaGroup",
+    "copyMessage",
+    "forwardMessage",
+    "editMessageText",
+    "editMessageCaption",
+    "editMessageMedia",
+    "editMessageReplyMarkup",
+}
+EDIT_METHODS = {"editMessageText", "editMessageCaption", "editMessageMedia", "editMessageReplyMarkup"}
+
+outbound_queue_latency = registry.histogram(
+    "bot_outbound_queue_seconds", "Time an outbound call waited for a rate-limit slot", ("method",)
+)
+outbound_sent = registry.counter("bot_outbound_sent_total", "Outbound calls sent through the rate limiter", ("method",))
+outbound_coalesced = registry.counter("bot_outbound_coalesced_total", "Edits superseded by a newer edit of the same message")
+outbound_retries = registry.counter("bot_outbound_retry_after_total", "Calls retried after a 429 retry_after")
+
+class TokenBucket:
+    """Reservation-style bucket: tokens may go negative, each caller learns how long to wait."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self) -> float:
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def pause(self, seconds: float) -> None:
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+    def idle(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+class PendingEdit:
+    def __init__(self, method: TelegramMethod):
+        self.method = method
+        self.future: Optional[asyncio.Future] = None
+
+class OutboundRateLimiter(BaseRequestMiddleware):
+    """Paces chat-bound Bot API calls with global and per-chat token buckets.
+
+    An edit that is still waiting for its slot is replaced by a newer edit of the same
+    message; both callers get the result of the one that is actually sent. before_wait
+    runs ahead of every pause, so a caller can give up what it should not hold while
+    it sleeps, such as a pooled DB connection.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        chat_burst: float = 3.0,
+        max_retries: int = 3,
+        max_chats: int = 10000,
+        before_wait: Optional[Callable[[], Awaitable[None]]] = None,
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self.before_wait = before_wait
+        self._chat_buckets: Dict[Any, TokenBucket] = {}
+        self._pending_edits: Dict[Tuple[Any, int], PendingEdit] = {}
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= self.max_chats:
+                self._chat_buckets = {key: value for key, value in self._chat_buckets.items() if not value.idle()}
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def _wait(self, delay: float) -> None:
+        if self.before_wait is not None:
+            await self.before_wait()
+        await asyncio.sleep(delay)
+
+    async def _acquire(self, chat_id: Any) -> None:
+        delay = self._chat_bucket(chat_id).reserve()
+        if delay:
+            await self._wait(delay)
+        delay = self.global_bucket.reserve()
+        if delay:
+            await self._wait(delay)
+
+    async def _send(self, make_request, bot: Bot, method: TelegramMethod, chat_id: Any):
+        for attempt in range(self.max_retries + 1):
+            try:
+                result = await make_request(bot, method)
+                outbound_sent.inc(method.__api_method__)
+                return result
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                outbound_retries.inc()
+                # everything else queued for this chat has to sit out the same window
+                self._chat_bucket(chat_id).pause(e.retry_after)
+                await self._wait(e.retry_after)
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ):
+        chat_id = getattr(method, "chat_id", None)
+        if method.__api_method__ not in RATE_LIMITED_METHODS or chat_id is None:
+            return await make_request(bot, method)
+
+        start = time.perf_counter()
+        message_id = getattr(method, "message_id", None)
+        if method.__api_method__ not in EDIT_METHODS or message_id is None:
+            await self._acquire(chat_id)
+            outbound_queue_latency.observe(time.perf_counter() - start, method.__api_method__)
+            return await self._send(make_request, bot, method, chat_id)
+
+        key = (chat_id, message_id)
+        pending = self._pending_edits.get(key)
+        if pending is not None:
+            pending.method = method
+            outbound_coalesced.inc()
+            if pending.future is None:
+                pending.future = asyncio.get_running_loop().create_future()
+            future = pending.future
+            if self.before_wait is not None:
+                await self.before_wait()
+            return await asyncio.shield(future)
+
+        pending = self._pending_edits[key] = PendingEdit(method)
+        try:
+            await self._acquire(chat_id)
+        except BaseException:
+            if pending.future is not None:
+                pending.future.cancel()
+            raise
+        finally:
+            del self._pending_edits[key]
+        outbound_queue_latency.observe(time.perf_counter() - start, method.__api_method__)
+        try:
+            result = await self._send(make_request, bot, pending.method, chat_id)
+        except Exception as e:
+            if pending.future is not None:
+                pending.future.set_exception(e)
+                pending.future.exception()
+            raise
+        if pending.future is not None:
+            pending.future.set_result(result)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "chats": len(self._chat_buckets),
+            "pending_edits": len(self._pending_edits),
+            "global_tokens": round(self.global_bucket.tokens, 3),
+        }
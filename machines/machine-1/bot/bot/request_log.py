@@ -0,0 +1,123 @@
+import json
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from functools import partial
+from typing import Awaitable, Callable, Dict, Iterable, Optional, TextIO
+
+from aiohttp import web
+
+DEFAULT_REDACTED_HEADERS = ("authorization", "cookie", "x-telegram-bot-api-secret-token")
+
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        path, _, rate = item.partition("=")
+        rates[path.strip()] = float(rate)
+    return rates
+
+class RequestLogWriter:
+    """Writes JSON lines from a bounded queue on a background thread; submit() never blocks."""
+
+    def __init__(
+        self,
+        stream: TextIO = sys.stdout,
+        max_queue: int = 10000,
+        batch_size: int = 256,
+        dumps: Callable[..., str] = partial(json.dumps, ensure_ascii=False),
+    ):
+        self.stream = stream
+        self.batch_size = batch_size
+        self.dumps = dumps
+        self.written = 0
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="request-log-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, record: dict) -> bool:
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            lines = [self.dumps(record, default=str) for record in batch if record is not None]
+            if lines:
+                self.stream.write("\n".join(lines) + "\n")
+                self.stream.flush()
+                self.written += len(lines)
+            if stop:
+                return
+
+    def stats(self) -> dict:
+        return {"queued": self._queue.qsize(), "written": self.written, "dropped": self.dropped}
+
+def create_request_log_middleware(
+    writer: RequestLogWriter,
+    sample_rates: Optional[Dict[str, float]] = None,
+    default_rate: float = 1.0,
+    max_body: int = 2048,
+    redacted_headers: Iterable[str] = DEFAULT_REDACTED_HEADERS,
+):
+    sample_rates = sample_rates or {}
+    redacted = {header.lower() for header in redacted_headers}
+
+    @web.middleware
+    async def request_log_middleware(request: web.Request, handler: Callable[[web.Request], Awaitable[web.StreamResponse]]):
+        rate = sample_rates.get(request.path, default_rate)
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            return await handler(request)
+
+        record = {
+            "ts": datetime.now(timezone.utc).isoformat(),
+            "method": request.method,
+            "path": request.path_qs,
+            "remote": request.remote,
+            "headers": {name: "[redacted]" if name.lower() in redacted else value for name, value in request.headers.items()},
+        }
+        if request.can_read_body and max_body > 0:
+            # aiohttp keeps the bytes, so the webhook handler parses these without reading again
+            body = await request.read()
+            record["body"] = body[:max_body].decode("utf-8", errors="replace")
+            if len(body) > max_body:
+                record["body_truncated"] = len(body)
+
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await handler(request)
+            status = response.status
+            return response
+        except web.HTTPException as e:
+            status = e.status
+            raise
+        finally:
+            record["status"] = status
+            record["duration_ms"] = round((time.perf_counter() - start) * 1000, 3)
+            writer.submit(record)
+
+    return request_log_middleware
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+def get_update_chat_id(update: Dict[str, Any]) -> Optional[int]:
+    callback_query = update.get("callback_query")
+    if callback_query:
+        message = callback_query.get("message")
+        if message:
+            return message["chat"]["id"]
+        return callback_query["from"]["id"]
+    for event in update.values():
+        if not isinstance(event, dict):
+            continue
+        if "chat" in event:
+            return event["chat"]["id"]
+        if "from" in event:
+            return event["from"]["id"]
+    return None
+
+class ChatLaneScheduler:
+    """Shards updates by chat id onto N lanes: one chat is handled strictly in order, different chats concurrently."""
+
+    def __init__(self, feed: Callable[..., Awaitable[Any]], lanes: int = 4, capacity: int = 1000):
+        self.feed = feed
+        self.capacity = capacity
+        self.processed = 0
+        self.failed = 0
+        self.wait_seconds_total = 0.0
+        self._queues: List[asyncio.Queue] = [asyncio.Queue() for _ in range(max(1, lanes))]
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def lanes(self) -> int:
+        return len(self._queues)
+
+    def depth(self) -> int:
+        return sum(queue.qsize() for queue in self._queues)
+
+    def full(self) -> bool:
+        return self.depth() >= self.capacity
+
+    def lane_for(self, chat_id: Optional[int]) -> int:
+        if chat_id is None:
+            return min(range(self.lanes), key=lambda index: self._queues[index].qsize())
+        return hash(chat_id) % self.lanes
+
+    def submit(self, chat_id: Optional[int], *args: Any) -> None:
+        self._queues[self.lane_for(chat_id)].put_nowait((args, time.monotonic()))
+
+    def drop_oldest(self, chat_id: Optional[int]) -> bool:
+        queue = self._queues[self.lane_for(chat_id)]
+        if queue.empty():
+            queue = max(self._queues, key=lambda lane: lane.qsize())
+        if queue.empty():
+            return False
+        queue.get_nowait()
+        queue.task_done()
+        return True
+
+    async def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._run_lane(queue)) for queue in self._queues]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def join(self) -> None:
+        for queue in self._queues:
+            await queue.join()
+
+    async def _run_lane(self, queue: asyncio.Queue) -> None:
+        while True:
+            args, enqueued_at = await queue.get()
+            self.wait_seconds_total += time.monotonic() - enqueued_at
+            try:
+                await self.feed(*args)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Update processing failed: {e}")
+            finally:
+                queue.task_done()
+
+    def stats(self) -> dict:
+        return {
+            "lanes": self.lanes,
+            "depth": self.depth(),
+            "lane_depths": [queue.qsize() for queue in self._queues],
+            "capacity": self.capacity,
+            "processed": self.processed,
+            "failed": self.failed,
+            "wait_seconds_total": round(self.wait_seconds_total, 6),
+        }
@@ -0,0 +1,83 @@
+import html
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional, Tuple
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup, Message
+
+from metrics import registry
+
+TAG = re.compile(r"<[^>]+>")
+
+screen_edits = registry.counter("bot_screen_edits_total", "Screen edits by outcome", ("result",))
+
+def plain_text(text: str) -> str:
+    # what Telegram hands back as message.text once the HTML is parsed and trimmed
+    return html.unescape(TAG.sub("", text)).strip()
+
+def keyboard_signature(markup: Optional[InlineKeyboardMarkup]) -> Tuple:
+    if markup is None:
+        return ()
+    return tuple(
+        tuple((button.text, button.callback_data, button.url) for button in row) for row in markup.inline_keyboard
+    )
+
+@dataclass(frozen=True)
+class Screen:
+    """Text and keyboard of one bot screen, with what they look like once delivered, computed once."""
+
+    text: str
+    reply_markup: Optional[InlineKeyboardMarkup] = None
+    plain: str = field(init=False, repr=False, compare=False)
+    signature: Tuple = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "plain", plain_text(self.text))
+        object.__setattr__(self, "signature", keyboard_signature(self.reply_markup))
+
+    def shown_in(self, message) -> bool:
+        # inaccessible messages carry no text, so they never match
+        return getattr(message, "text", None) == self.plain and keyboard_signature(
+            getattr(message, "reply_markup", None)
+        ) == self.signature
+
+async def edit_screen(message: Message, screen: Screen, **kwargs) -> bool:
+    """Edits message into screen unless it already shows it; returns whether an edit went out."""
+    if screen.shown_in(message):
+        screen_edits.inc("skipped")
+        return False
+    try:
+        await message.edit_text(screen.text, reply_markup=screen.reply_markup, **kwargs)
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            raise
+        screen_edits.inc("not_modified")
+        return False
+    screen_edits.inc("edited")
+    return True
+
+class ScreenCache:
+    """Screens rendered from a generator snapshot, built once per snapshot and shared by every chat.
+
+    A snapshot is identified by the object itself: the snapshot cache hands out the same
+    instance until the row changes.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._screens: Dict[str, tuple] = {}
+
+    def get(self, name: str, render: Callable[[object], Screen], source, *version) -> Screen:
+        entry = self._screens.get(name)
+        if entry is not None and entry[0] is source and entry[1] == version:
+            self.hits += 1
+            return entry[2]
+        self.misses += 1
+        screen = render(source)
+        self._screens[name] = (source, version, screen)
+        return screen
+
+    def stats(self) -> dict:
+        return {"screens": len(self._screens), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,250 @@
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from dataclasses import dataclass, field
+from typing import Any, Dict, Mapping, Optional, Set
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+from sqlalchemy import select, delete, func
+from sqlalchemy.dialects.postgresql import insert
+from db.models import FsmState
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class StorageRecord:
+    state: Optional[str] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+    loaded_at: float = 0.0
+    touched_at: float = 0.0
+
+class PostgresStorage(BaseStorage):
+    """FSM storage in the fsm_states table with an in-memory read-through layer and write-behind flushes.
+
+    cache_ttl=0 and flush_interval=0 make it read- and write-through, which is what
+    several processes sharing the table need.
+    """
+
+    def __init__(
+        self,
+        session_maker,
+        key_builder: Optional[KeyBuilder] = None,
+        cache_ttl: float = 300.0,
+        flush_interval: float = 1.0,
+        idle_ttl: float = 3600.0,
+        state_ttl: float = 86400.0,
+        lock_stripes: int = 256,
+    ):
+        self.session_maker = session_maker
+        self.key_builder = key_builder or DefaultKeyBuilder()
+        self.cache_ttl = cache_ttl
+        self.flush_interval = flush_interval
+        self.idle_ttl = idle_ttl
+        self.state_ttl = state_ttl
+        self.flushes = 0
+        self.flushed_keys = 0
+        self.evicted = 0
+        self.expired = 0
+        self._records: Dict[str, StorageRecord] = {}
+        self._dirty: Set[str] = set()
+        # taken out of _dirty by a flush whose commit has not returned yet
+        self._flushing: Set[str] = set()
+        # a fixed set of locks shared by hash keeps memory bounded however many chats show up
+        self._locks = [asyncio.Lock() for _ in range(lock_stripes)]
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self._last_expiry = time.monotonic()
+
+    def _lock(self, key: str) -> asyncio.Lock:
+        return self._locks[hash(key) % len(self._locks)]
+
+    def _ensure_task(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        interval = self.flush_interval or min(self.idle_ttl, 60.0)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush()
+                self._evict_idle()
+                if time.monotonic() - self._last_expiry >= min(self.state_ttl, 3600.0):
+                    await self.expire_states()
+            except Exception as e:
+                logger.error(f"FSM storage maintenance failed: {e}")
+
+    def _evict_idle(self) -> None:
+        deadline = time.monotonic() - self.idle_ttl
+        for key in [key for key, record in self._records.items() if record.touched_at < deadline and not self._pending(key)]:
+            del self._records[key]
+            self.evicted += 1
+
+    async def expire_states(self) -> None:
+        self._last_expiry = time.monotonic()
+        async with self.session_maker() as session:
+            result = await session.execute(
+                delete(FsmState).where(FsmState.updated_at < func.now() - timedelta(seconds=self.state_ttl))
+            )
+            await session.commit()
+        self.expired += result.rowcount
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            keys, self._dirty = self._dirty, set()
+            self._flushing = keys
+            rows, cleared = [], []
+            for key in keys:
+                record = self._records.get(key)
+                if record is None:
+                    continue
+                if record.state is None and not record.data:
+                    cleared.append(key)
+                else:
+                    rows.append({"key": key, "state": record.state, "data": record.data})
+            try:
+                async with self.session_maker() as session:
+                    if rows:
+                        stmt = insert(FsmState).values(rows)
+                        await session.execute(stmt.on_conflict_do_update(
+                            index_elements=[FsmState.key],
+                            set_={"state": stmt.excluded.state, "data": stmt.excluded.data, "updated_at": func.now()},
+                        ))
+                    if cleared:
+                        await session.execute(delete(FsmState).where(FsmState.key.in_(cleared)))
+                    await session.commit()
+            except Exception:
+                # keep the keys dirty so the next flush retries them
+                self._dirty |= keys
+                raise
+            finally:
+                self._flushing = set()
+            self.flushes += 1
+            self.flushed_keys += len(keys)
+
+    def _pending(self, key: str) -> bool:
+        return key in self._dirty or key in self._flushing
+
+    async def _get_record(self, key: str) -> StorageRecord:
+        now = time.monotonic()
+        record = self._records.get(key)
+        # until its flush commits, the row in the table is older than the record
+        if record is not None and (self._pending(key) or now - record.loaded_at < self.cache_ttl):
+            record.touched_at = now
+            return record
+        async with self.session_maker() as session:
+            result = await session.execute(select(FsmState).where(FsmState.key == key))
+            row = result.scalar_one_or_none()
+        record = StorageRecord(
+            state=row.state if row else None,
+            data=dict(row.data) if row else {},
+            loaded_at=now,
+            touched_at=now,
+        )
+        if self.cache_ttl > 0:
+            self._records[key] = record
+        return record
+
+    @property
+    def write_behind(self) -> bool:
+        return self.flush_interval > 0 and self.cache_ttl > 0
+
+    def _store(self, key: str, record: StorageRecord) -> None:
+        # after a local write the record is what the table holds or is about to hold
+        record.loaded_at = record.touched_at = time.monotonic()
+        if self.cache_ttl > 0:
+            self._records[key] = record
+        if self.write_behind:
+            self._dirty.add(key)
+        self._ensure_task()
+
+    async def _write_through(self, key: str, record: StorageRecord, **changes: Any) -> StorageRecord:
+        # only the changed column is overwritten, so other processes' writes to the row survive
+        stmt = insert(FsmState).values(key=key, state=record.state, data=record.data)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[FsmState.key],
+            set_={**changes, "updated_at": func.now()},
+        ).returning(FsmState.state, FsmState.data)
+        async with self.session_maker() as session:
+            row = (await session.execute(stmt)).one()
+            await session.commit()
+        return StorageRecord(state=row.state, data=dict(row.data), loaded_at=time.monotonic())
+
+    async def _cached_or_empty(self, key: str) -> StorageRecord:
+        if self.cache_ttl > 0:
+            return await self._get_record(key)
+        return StorageRecord()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self.key_builder.build(key)
+        state = state.state if isinstance(state, State) else state
+        async with self._lock(storage_key):
+            record = await self._cached_or_empty(storage_key)
+            record = StorageRecord(state, record.data, record.loaded_at)
+            if not self.write_behind:
+                record = await self._write_through(storage_key, record, state=state)
+            self._store(storage_key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        storage_key = self.key_builder.build(key)
+        async with self._lock(storage_key):
+            return (await self._get_record(storage_key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(f"Data must be a dict or dict-like object, got {type(data).__name__}")
+        storage_key = self.key_builder.build(key)
+        async with self._lock(storage_key):
+            record = await self._cached_or_empty(storage_key)
+            record = StorageRecord(record.state, data.copy(), record.loaded_at)
+            if not self.write_behind:
+                record = await self._write_through(storage_key, record, data=record.data)
+            self._store(storage_key, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        storage_key = self.key_builder.build(key)
+        async with self._lock(storage_key):
+            return (await self._get_record(storage_key)).data.copy()
+
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> Dict[str, Any]:
+        # read-modify-write under one lock, so concurrent updates of a key do not lose fields;
+        # write-through merges in SQL so that holds across processes as well
+        storage_key = self.key_builder.build(key)
+        async with self._lock(storage_key):
+            if self.write_behind:
+                record = await self._get_record(storage_key)
+                record = StorageRecord(record.state, {**record.data, **data}, record.loaded_at)
+            else:
+                record = await self._write_through(
+                    storage_key,
+                    StorageRecord(data=dict(data)),
+                    data=FsmState.data.op("||")(insert(FsmState).excluded.data),
+                )
+            self._store(storage_key, record)
+            return record.data.copy()
+
+    def stats(self) -> dict:
+        return {
+            "cached": len(self._records),
+            "dirty": len(self._dirty),
+            "flushes": self.flushes,
+            "flushed_keys": self.flushed_keys,
+            "evicted": self.evicted,
+            "expired": self.expired,
+        }
@@ -0,0 +1,115 @@
+import asyncio
+import random
+from typing import Dict, Optional
+
+from aiohttp import ClientConnectorError, UnixConnector
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.exceptions import TelegramNetworkError, TelegramServerError
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from metrics import registry
+
+DEFAULT_METHOD_TIMEOUTS = {
+    "answerCallbackQuery": 5.0,
+    "sendMessage": 10.0,
+    "editMessageText": 10.0,
+    "editMessageReplyMarkup": 10.0,
+    "deleteMessage": 10.0,
+    "sendPhoto": 30.0,
+    "sendDocument": 60.0,
+}
+# sending one of these twice leaves the chat in the same state
+RETRYABLE_METHODS = {
+    "answerCallbackQuery",
+    "editMessageText",
+    "editMessageCaption",
+    "editMessageReplyMarkup",
+    "deleteMessage",
+    "getMe",
+    "getWebhookInfo",
+    "setWebhook",
+    "deleteWebhook",
+    "setMyCommands",
+}
+
+api_retries = registry.counter("bot_telegram_api_retries_total", "Bot API calls retried after a network or 5xx error", ("method",))
+
+def parse_method_timeouts(value: str) -> Dict[str, float]:
+    timeouts = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        method, _, seconds = item.partition("=")
+        timeouts[method.strip()] = float(seconds)
+    return timeouts
+
+class TunedAiohttpSession(AiohttpSession):
+    """AiohttpSession for a nearby telegram-bot-api server.
+
+    Keeps a bounded pool of keep-alive connections (or a unix socket), caches DNS,
+    gives each method its own timeout and retries failed calls with jittered backoff.
+    A call that may have reached the server is only retried for RETRYABLE_METHODS.
+    """
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 0,
+        keepalive_timeout: float = 30.0,
+        dns_cache_ttl: int = 3600,
+        unix_socket: Optional[str] = None,
+        method_timeouts: Optional[Dict[str, float]] = None,
+        retries: int = 2,
+        retry_backoff: float = 0.2,
+        retry_backoff_max: float = 2.0,
+        **kwargs,
+    ):
+        super().__init__(limit=limit, **kwargs)
+        if unix_socket:
+            self._connector_type = UnixConnector
+            self._connector_init = {"path": unix_socket, "limit": limit, "keepalive_timeout": keepalive_timeout}
+        else:
+            self._connector_init.update(
+                limit_per_host=limit_per_host,
+                keepalive_timeout=keepalive_timeout,
+                ttl_dns_cache=dns_cache_ttl,
+                use_dns_cache=True,
+            )
+        self.method_timeouts = {**DEFAULT_METHOD_TIMEOUTS, **(method_timeouts or {})}
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+
+    def _backoff(self, attempt: int) -> float:
+        # full jitter, so callers that failed together do not come back together
+        return random.uniform(0, min(self.retry_backoff_max, self.retry_backoff * 2 ** attempt))
+
+    @staticmethod
+    def _never_sent(error: TelegramNetworkError) -> bool:
+        # AiohttpSession raises inside its except block, so the aiohttp error is the implicit context
+        return isinstance(error.__cause__ or error.__context__, ClientConnectorError)
+
+    async def make_request(
+        self, bot: Bot, method: TelegramMethod[TelegramType], timeout: Optional[int] = None
+    ) -> TelegramType:
+        api_method = method.__api_method__
+        if timeout is None:
+            timeout = self.method_timeouts.get(api_method, self.timeout)
+        retryable = api_method in RETRYABLE_METHODS
+        attempt = 0
+        while True:
+            try:
+                return await super().make_request(bot, method, timeout)
+            except TelegramNetworkError as e:
+                # a connection that was never made sent nothing, so any method may go again
+                error = e
+                can_retry = retryable or self._never_sent(e)
+            except TelegramServerError as e:
+                error = e
+                can_retry = retryable
+            if not can_retry or attempt >= self.retries:
+                raise error
+            api_retries.inc(api_method)
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
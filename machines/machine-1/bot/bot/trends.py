@@ -0,0 +1,151 @@
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+from db.models import TELEMETRY_METRICS, generator_telemetry
+
+SPARK_BLOCKS = "▁▂▃▄▅▆▇█"
+
+def epoch(moment: datetime) -> float:
+    # generator_data.updated_at is stored without a zone, in UTC
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+def lttb(xs: Sequence[float], ys: Sequence[float], threshold: int) -> Tuple[List[float], List[float]]:
+    """Largest-Triangle-Three-Buckets: keeps the threshold points that preserve the shape best, in one pass."""
+    length = len(ys)
+    if threshold >= length or threshold < 3:
+        return list(xs), list(ys)
+    sampled_x, sampled_y = [xs[0]], [ys[0]]
+    every = (length - 2) / (threshold - 2)
+    anchor = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        # the average of the next bucket stands in for the third vertex
+        next_end = min(int((bucket + 2) * every) + 1, length)
+        next_count = next_end - end
+        avg_x = sum(xs[end:next_end]) / next_count
+        avg_y = sum(ys[end:next_end]) / next_count
+        ax, ay = xs[anchor], ys[anchor]
+        best, best_area = start, -1.0
+        for index in range(start, end):
+            area = abs((ax - avg_x) * (ys[index] - ay) - (ax - xs[index]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = index, area
+        sampled_x.append(xs[best])
+        sampled_y.append(ys[best])
+        anchor = best
+    sampled_x.append(xs[-1])
+    sampled_y.append(ys[-1])
+    return sampled_x, sampled_y
+
+def sparkline(values: Sequence[float]) -> str:
+    if not values:
+        return ""
+    low, high = min(values), max(values)
+    if high == low:
+        return SPARK_BLOCKS[len(SPARK_BLOCKS) // 2] * len(values)
+    scale = (len(SPARK_BLOCKS) - 1) / (high - low)
+    return "".join(SPARK_BLOCKS[round((value - low) * scale)] for value in values)
+
+class MetricRing:
+    """Fixed-capacity ring of samples in flat array('d') buffers, 8 bytes per value."""
+
+    def __init__(self, capacity: int, fields: int):
+        self.capacity = capacity
+        self.times = array("d", bytes(8 * capacity))
+        self.values = [array("d", bytes(8 * capacity)) for _ in range(fields)]
+        self.size = 0
+        self._next = 0
+
+    def append(self, moment: float, row: Sequence[float]) -> None:
+        self.times[self._next] = moment
+        for column, value in zip(self.values, row):
+            column[self._next] = value
+        self._next = (self._next + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def _ordered(self, buffer: array) -> array:
+        if self.size < self.capacity:
+            return buffer[:self.size]
+        return buffer[self._next:] + buffer[:self._next]
+
+    def window(self, field: int, since: float) -> Tuple[array, array]:
+        times = self._ordered(self.times)
+        start = bisect_left(times, since)
+        return times[start:], self._ordered(self.values[field])[start:]
+
+class TrendHistory:
+    """Recent history of one generator's metrics, so the monitoring screen needs no query per tap.
+
+    Samples come from every generator row the bot sees and are kept once per updated_at.
+    Summaries are cached until the next sample arrives.
+    """
+
+    def __init__(self, generator_id: int, window: float = 86400.0, capacity: int = 8640, points: int = 24,
+                 metrics: Sequence[str] = TELEMETRY_METRICS):
+        self.generator_id = generator_id
+        self.window = window
+        self.points = points
+        self.metrics = tuple(metrics)
+        self._index = {metric: index for index, metric in enumerate(self.metrics)}
+        self._ring = MetricRing(capacity, len(self.metrics))
+        self._last = float("-inf")
+        self._summaries: Dict[tuple, tuple] = {}
+        self.samples = 0
+
+    def add(self, moment: float, row: Sequence[float]) -> bool:
+        if moment <= self._last:
+            return False
+        self._last = moment
+        self._ring.append(moment, row)
+        self._summaries.clear()
+        self.samples += 1
+        return True
+
+    def observe(self, gen_data) -> bool:
+        if gen_data is None or gen_data.updated_at is None:
+            return False
+        return self.add(epoch(gen_data.updated_at), [getattr(gen_data, metric) for metric in self.metrics])
+
+    @property
+    def version(self) -> int:
+        return self.samples
+
+    def series(self, metric: str, window: Optional[float] = None, points: Optional[int] = None) -> Tuple[List[float], List[float]]:
+        """The samples of the last window seconds, downsampled to at most points."""
+        times, values = self._ring.window(self._index[metric], self._last - (window or self.window))
+        return lttb(times, values, points or self.points)
+
+    def summary(self, metric: str, window: Optional[float] = None) -> Optional[tuple]:
+        """(min, avg, max, sparkline) over the window, or None without samples."""
+        key = (metric, window or self.window)
+        cached = self._summaries.get(key)
+        if cached is not None:
+            return cached
+        times, values = self._ring.window(self._index[metric], self._last - key[1])
+        if not values:
+            return None
+        _, sampled = lttb(times, values, self.points)
+        cached = (min(values), sum(values) / len(values), max(values), sparkline(sampled))
+        self._summaries[key] = cached
+        return cached
+
+    async def backfill(self, session) -> int:
+        """Seeds the ring from the telemetry history written by the updater."""
+        recorded_at = generator_telemetry.c.recorded_at
+        since = datetime.now(timezone.utc).timestamp() - self.window
+        result = await session.execute(
+            select(recorded_at, *(generator_telemetry.c[metric] for metric in self.metrics))
+            .where(generator_telemetry.c.generator_id == self.generator_id)
+            .where(recorded_at >= datetime.fromtimestamp(since, timezone.utc))
+            .order_by(recorded_at)
+        )
+        return sum(self.add(epoch(row[0]), row[1:]) for row in result)
+
+    def stats(self) -> dict:
+        return {"samples": self.samples, "buffered": self._ring.size, "capacity": self._ring.capacity}
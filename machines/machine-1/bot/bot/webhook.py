@@ -0,0 +1,185 @@
+import asyncio
+import hmac
+import ipaddress
+from typing import Any, Awaitable, Callable, Iterable, List, Optional, Union
+
+from aiohttp import web
+from aiohttp.web_app import Application
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+
+from dedup import UpdateDeduplicator
+from metrics import registry
+from scheduler import ChatLaneScheduler, get_update_chat_id
+
+BACKPRESSURE_REJECT = "reject"
+BACKPRESSURE_DROP_OLDEST = "drop_oldest"
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+webhook_rejected = registry.counter("bot_webhook_rejected_total", "Requests to the webhook, /stats or /metrics refused before the body was read", ("reason",))
+
+def parse_allowed_networks(value: str) -> List[Network]:
+    return [ipaddress.ip_network(item.strip(), strict=False) for item in value.split(",") if item.strip()]
+
+def remote_allowed(request: web.Request, allowed_networks: List[Network]) -> bool:
+    try:
+        remote = ipaddress.ip_address(request.remote or "")
+    except ValueError:
+        return False
+    return any(remote in network for network in allowed_networks)
+
+def create_internal_guard_middleware(paths: Iterable[str], allowed_networks: List[Network]):
+    """Serves the given paths (/stats, /metrics) only to clients inside allowed_networks."""
+    paths = frozenset(paths)
+
+    @web.middleware
+    async def internal_guard_middleware(request: web.Request, handler: Callable[[web.Request], Awaitable[web.StreamResponse]]):
+        if request.path in paths and not remote_allowed(request, allowed_networks):
+            webhook_rejected.inc("internal")
+            return web.Response(status=403, text="Forbidden")
+        return await handler(request)
+
+    return internal_guard_middleware
+
+def create_webhook_guard_middleware(
+    path: str,
+    secret_token: Optional[str] = None,
+    allowed_networks: Optional[List[Network]] = None,
+):
+    """Refuses webhook POSTs from outside allowed_networks or without the secret_token header.
+
+    It goes first in the middleware list, so a refused request is not logged and its body
+    is never read or parsed. Either check is off while its setting is empty.
+    """
+    expected = secret_token.encode() if secret_token else None
+
+    @web.middleware
+    async def webhook_guard_middleware(request: web.Request, handler: Callable[[web.Request], Awaitable[web.StreamResponse]]):
+        if request.path != path:
+            return await handler(request)
+        if allowed_networks and not remote_allowed(request, allowed_networks):
+            webhook_rejected.inc("address")
+            return web.Response(status=403, text="Forbidden")
+        if expected is not None:
+            received = request.headers.get(SECRET_HEADER, "").encode()
+            if not hmac.compare_digest(received, expected):
+                webhook_rejected.inc("secret")
+                return web.Response(status=401, text="Unauthorized")
+        return await handler(request)
+
+    return webhook_guard_middleware
+
+class DedupRequestHandler(SimpleRequestHandler):
+    """SimpleRequestHandler that acks a redelivered update_id without feeding it again.
+
+    telegram-bot-api sends an update again when the POST fails or is not answered in
+    time, while the first delivery may still be in its handler. Like SimpleRequestHandler
+    it acks right away and feeds the update in a task. With handle_in_background=False,
+    an update whose handler raised is released, so the redelivery that the 500 asks for
+    is fed.
+    """
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        dedup: Optional[UpdateDeduplicator] = None,
+        handle_in_background: bool = True,
+        **data: Any,
+    ) -> None:
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=handle_in_background, **data)
+        self.dedup = dedup
+
+    async def _first_seen(self, update: dict) -> bool:
+        return self.dedup is None or await self.dedup.first_seen(update.get("update_id"))
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        update = bot.session.json_loads(await request.read())
+        if await self._first_seen(update):
+            task = asyncio.create_task(self._background_feed_update(bot=bot, update=update))
+            self._background_feed_update_tasks.add(task)
+            task.add_done_callback(self._background_feed_update_tasks.discard)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def _handle_request(self, bot: Bot, request: web.Request) -> web.Response:
+        update = bot.session.json_loads(await request.read())
+        if not await self._first_seen(update):
+            return web.json_response({}, dumps=bot.session.json_dumps)
+        try:
+            result = await self.dispatcher.feed_webhook_update(bot, update, **self.data)
+        except Exception:
+            if self.dedup is not None:
+                await self.dedup.release(update.get("update_id"))
+            raise
+        return web.Response(body=self._build_response_writer(bot=bot, result=result))
+
+class QueuedRequestHandler(DedupRequestHandler):
+    """Acks the webhook POST right away and feeds updates through a bounded per-chat lane scheduler."""
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        workers: int = 4,
+        queue_size: int = 1000,
+        backpressure: str = BACKPRESSURE_REJECT,
+        dedup: Optional[UpdateDeduplicator] = None,
+        **data: Any,
+    ) -> None:
+        if backpressure not in (BACKPRESSURE_REJECT, BACKPRESSURE_DROP_OLDEST):
+            raise ValueError(f"Unknown backpressure policy: {backpressure}")
+        super().__init__(dispatcher=dispatcher, bot=bot, dedup=dedup, handle_in_background=True, **data)
+        self.backpressure = backpressure
+        # one worker per lane keeps updates of a chat in delivery order
+        self.scheduler = ChatLaneScheduler(self._background_feed_update, lanes=workers, capacity=queue_size)
+        self.accepted = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    def register(self, app: Application, /, path: str, **kwargs: Any) -> None:
+        super().register(app, path=path, **kwargs)
+        app.on_startup.append(self._start_workers)
+
+    async def _start_workers(self, app: Application) -> None:
+        await self.scheduler.start()
+
+    async def close(self) -> None:
+        await self.scheduler.stop()
+        await super().close()
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        # straight from the bytes the request log may already have read; no str decode in between
+        update = bot.session.json_loads(await request.read())
+        chat_id = get_update_chat_id(update)
+        if self.scheduler.full() and self.backpressure == BACKPRESSURE_REJECT:
+            self.rejected += 1
+            # telegram-bot-api keeps the update and redelivers it later
+            return web.json_response(
+                {"ok": False, "error_code": 429, "description": "Too Many Requests"},
+                status=429,
+                headers={"Retry-After": "1"},
+                dumps=bot.session.json_dumps,
+            )
+        # after the 429, which asks for the redelivery that this would drop
+        if not await self._first_seen(update):
+            return web.json_response({}, dumps=bot.session.json_dumps)
+        if self.scheduler.full() and self.scheduler.drop_oldest(chat_id):
+            self.dropped += 1
+        self.scheduler.submit(chat_id, bot, update)
+        self.accepted += 1
+        self.max_depth = max(self.max_depth, self.scheduler.depth())
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    def stats(self) -> dict:
+        return {
+            **self.scheduler.stats(),
+            "backpressure": self.backpressure,
+            "max_depth": self.max_depth,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+        }
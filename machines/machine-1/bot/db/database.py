@@ -1,16 +1,87 @@
+import asyncio
 import os
+import time
+
+from sqlalchemy import exc
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-def get_database_url():
+def get_database_url(driver="postgresql+asyncpg"):
     DB_HOST = os.getenv("DB_HOST", "db")
     DB_PORT = os.getenv("DB_PORT", "5432")
     DB_NAME = os.getenv("DB_NAME", "postgres")
     DB_USER = os.getenv("DB_USER", "postgres")
     DB_PASS = os.getenv("DB_PASS", "postgres")
-    return f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+    return f"{driver}://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+def get_pool_options():
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+    DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "connect_args": {"prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE},
+    }
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that counts checkouts and times how long they wait for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.max_overflow_seen = 0
+        self.checkout_seconds_total = 0.0
+        self.checkout_seconds_max = 0.0
+
+    def _do_get(self):
+        # no idle connection and no overflow slot left: this checkout has to queue
+        if self._pool.empty() and self._max_overflow > -1 and self._overflow >= self._max_overflow:
+            self.waits += 1
+        start = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        elapsed = time.perf_counter() - start
+        self.checkouts += 1
+        self.checkout_seconds_total += elapsed
+        self.checkout_seconds_max = max(self.checkout_seconds_max, elapsed)
+        self.max_overflow_seen = max(self.max_overflow_seen, self.overflow())
+        return record
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size(),
+            "checked_in": self.checkedin(),
+            "checked_out": self.checkedout(),
+            "overflow": max(self.overflow(), 0),
+            "max_overflow_seen": max(self.max_overflow_seen, 0),
+            "checkouts": self.checkouts,
+            "waits": self.waits,
+            "timeouts": self.timeouts,
+            "checkout_seconds_total": round(self.checkout_seconds_total, 6),
+            "checkout_seconds_max": round(self.checkout_seconds_max, 6),
+        }
 
 def create_db_engine(echo=False):
-    return create_async_engine(get_database_url(), echo=echo)
+    return create_async_engine(get_database_url(), echo=echo, poolclass=InstrumentedQueuePool, **get_pool_options())
 
 def create_session_maker(engine):
-    return async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
\ No newline at end of file
+    return async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+async def warm_pool(engine, connections=None):
+    connections = connections or engine.pool.size()
+    opened = [engine.connect() for _ in range(connections)]
+    # hold them all at once so the pool really opens that many
+    await asyncio.gather(*(connection.start() for connection in opened))
+    await asyncio.gather(*(connection.close() for connection in opened))
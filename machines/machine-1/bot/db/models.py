@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, Float, String, Boolean, DateTime, BigInteger
+from sqlalchemy import Column, Integer, Float, String, Boolean, DateTime, BigInteger, SmallInteger, Table, Index
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.sql import func
 
@@ -26,3 +27,61 @@ class User(Base):
     username = Column(String, nullable=True)
     is_admin = Column(Boolean, default=False)
     registered_at = Column(DateTime, server_default=func.now())
+
+class FsmState(Base):
+    __tablename__ = "fsm_states"
+    key = Column(String, primary_key=True)
+    state = Column(String, nullable=True)
+    data = Column(JSONB, nullable=False, server_default="{}")
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+class AlertSubscription(Base):
+    __tablename__ = "alert_subscriptions"
+    chat_id = Column(BigInteger, primary_key=True)
+    min_level = Column(SmallInteger, nullable=False, default=1)
+    created_at = Column(DateTime, server_default=func.now())
+
+class AlertState(Base):
+    __tablename__ = "alert_states"
+    metric = Column(String, primary_key=True)
+    level = Column(SmallInteger, nullable=False, default=0)
+    value = Column(Float, nullable=True)
+    changed_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+class LiveMonitor(Base):
+    __tablename__ = "live_monitors"
+    chat_id = Column(BigInteger, primary_key=True)
+    message_id = Column(BigInteger, nullable=False)
+    text_hash = Column(String, nullable=True)
+    started_at = Column(DateTime, server_default=func.now())
+
+# only a dedup window; losing it in a crash costs nothing, so skip the WAL
+class ProcessedUpdate(Base):
+    __tablename__ = "processed_updates"
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
+    update_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    received_at = Column(DateTime, server_default=func.now())
+
+TELEMETRY_METRICS = (
+    "power_output",
+    "temperature",
+    "pressure",
+    "voltage",
+    "frequency",
+    "fuel_level",
+    "coolant_flow",
+    "turbine_rpm",
+    "efficiency",
+    "vibration_level",
+)
+
+# append-only and partitioned by day, so it has no primary key; BRIN fits rows arriving in time order
+generator_telemetry = Table(
+    "generator_telemetry",
+    Base.metadata,
+    Column("generator_id", Integer, nullable=False),
+    Column("recorded_at", DateTime(timezone=True), nullable=False),
+    *(Column(name, Float) for name in TELEMETRY_METRICS),
+    Index("generator_telemetry_recorded_at_brin", "recorded_at", postgresql_using="brin"),
+    postgresql_partition_by="RANGE (recorded_at)",
+)
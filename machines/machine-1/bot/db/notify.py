@@ -0,0 +1,132 @@
+import asyncio
+import json
+import logging
+from datetime import datetime
+from typing import Callable, Dict, List
+
+import asyncpg
+
+from db.database import get_database_url
+
+GENERATOR_CHANNEL = "generator_data_changed"
+USERS_CHANNEL = "users_changed"
+# the updater publishes each new row here itself, so listeners need not SELECT it
+GENERATOR_SNAPSHOT_CHANNEL = "generator_snapshot"
+# set for the statement that already published snapshots, so the trigger stays quiet
+SNAPSHOT_PUBLISHED_SETTING = "generator_data.snapshot_published"
+
+# Statement-level, so one UPDATE of thousands of generators is one notification.
+# The payload lists the changed ids, or is empty when there are too many to list.
+GENERATOR_NOTIFY_MAX_IDS = 100
+GENERATOR_NOTIFY_DDL = (
+    f"""
+    CREATE OR REPLACE FUNCTION notify_generator_data_changed() RETURNS trigger AS $$
+    DECLARE
+        changed integer;
+        ids text;
+    BEGIN
+        IF current_setting('{SNAPSHOT_PUBLISHED_SETTING}', true) = 'on' THEN
+            RETURN NULL;
+        END IF;
+        SELECT count(*), string_agg(id::text, ',') INTO changed, ids FROM changed_rows;
+        IF changed > 0 THEN
+            PERFORM pg_notify('{GENERATOR_CHANNEL}', CASE WHEN changed <= {GENERATOR_NOTIFY_MAX_IDS} THEN ids ELSE '' END);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS generator_data_changed ON generator_data",
+    # transition tables allow only one event per trigger
+    """
+    CREATE OR REPLACE TRIGGER generator_data_inserted
+    AFTER INSERT ON generator_data
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_generator_data_changed()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER generator_data_updated
+    AFTER UPDATE ON generator_data
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_generator_data_changed()
+    """,
+)
+
+def generator_ids(payload: str):
+    """Ids named by a generator_data_changed payload, or None when it does not list them."""
+    if not payload:
+        return None
+    return {int(item) for item in payload.split(",")}
+
+def parse_generator_snapshot(payload: str) -> dict:
+    snapshot = json.loads(payload)
+    snapshot["updated_at"] = datetime.fromisoformat(snapshot["updated_at"])
+    return snapshot
+
+logger = logging.getLogger(__name__)
+
+async def install_notify_triggers(conn):
+    for statement in GENERATOR_NOTIFY_DDL:
+        await conn.exec_driver_sql(statement)
+
+class NotificationListener:
+    """Keeps one dedicated asyncpg connection LISTENing on the registered channels."""
+
+    def __init__(self, reconnect_delay: float = 5.0):
+        self.reconnect_delay = reconnect_delay
+        self.connected = False
+        self._callbacks: Dict[str, List[Callable[[str], None]]] = {}
+        self._on_connect: List[Callable[[], None]] = []
+        self._task = None
+
+    def add_listener(self, channel: str, callback: Callable[[str], None]):
+        self._callbacks.setdefault(channel, []).append(callback)
+
+    def on_connect(self, callback: Callable[[], None]):
+        self._on_connect.append(callback)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _dispatch(self, connection, pid, channel, payload):
+        for callback in self._callbacks.get(channel, ()):
+            try:
+                callback(payload)
+            except Exception as e:
+                logger.error(f"Notification callback for {channel} failed: {e}")
+
+    async def _run(self):
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(get_database_url(driver="postgresql"))
+                closed = asyncio.Event()
+                connection.add_termination_listener(lambda conn: closed.set())
+                for channel in self._callbacks:
+                    await connection.add_listener(channel, self._dispatch)
+                self.connected = True
+                # anything published while we were disconnected is lost
+                for callback in self._on_connect:
+                    callback()
+                logger.info(f"Listening on {', '.join(self._callbacks)}")
+                await closed.wait()
+                logger.warning("Notification connection closed")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Notification listener error: {e}")
+            finally:
+                self.connected = False
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            await asyncio.sleep(self.reconnect_delay)
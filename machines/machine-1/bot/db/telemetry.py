@@ -0,0 +1,137 @@
+import asyncio
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional, Sequence, Set
+
+from sqlalchemy import text
+
+from db.models import TELEMETRY_METRICS, generator_telemetry
+
+TELEMETRY_COLUMNS = ("generator_id", "recorded_at", *TELEMETRY_METRICS)
+PARTITION_PREFIX = f"{generator_telemetry.name}_"
+
+logger = logging.getLogger(__name__)
+
+def partition_name(day: date) -> str:
+    return f"{PARTITION_PREFIX}{day:%Y%m%d}"
+
+async def create_partition(conn, day: date) -> None:
+    # day partitions on UTC boundaries
+    await conn.exec_driver_sql(
+        f"CREATE TABLE IF NOT EXISTS {partition_name(day)} PARTITION OF {generator_telemetry.name} "
+        f"FOR VALUES FROM ('{day.isoformat()} 00:00+00') TO ('{(day + timedelta(days=1)).isoformat()} 00:00+00')"
+    )
+
+async def ensure_partitions(conn, days_ahead: int = 1, today: Optional[date] = None) -> None:
+    today = today or datetime.now(timezone.utc).date()
+    for offset in range(days_ahead + 1):
+        await create_partition(conn, today + timedelta(days=offset))
+
+async def drop_expired_partitions(conn, retention_days: int, today: Optional[date] = None) -> List[str]:
+    cutoff = (today or datetime.now(timezone.utc).date()) - timedelta(days=retention_days)
+    result = await conn.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "WHERE parent.relname = :parent"
+        ),
+        {"parent": generator_telemetry.name},
+    )
+    dropped = []
+    for name in result.scalars():
+        try:
+            day = datetime.strptime(name[len(PARTITION_PREFIX):], "%Y%m%d").date()
+        except ValueError:
+            continue
+        if day < cutoff:
+            # dropping a whole partition is a catalog change, not a DELETE of every row
+            await conn.exec_driver_sql(f"DROP TABLE IF EXISTS {name}")
+            dropped.append(name)
+    return dropped
+
+class TelemetryWriter:
+    """Buffers telemetry samples and appends them to generator_telemetry with COPY, one batch at a time."""
+
+    def __init__(self, engine, batch_size: int = 1000, flush_interval: float = 30.0, max_buffer: int = 100000):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self._buffer: List[tuple] = []
+        self._partitions: Set[date] = set()
+        self._full = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+
+    def add(self, generator_id: int, recorded_at: datetime, values: Sequence[float]) -> None:
+        if len(self._buffer) >= self.max_buffer:
+            # the database is behind; shed the newest samples rather than grow without bound
+            self.dropped += 1
+            return
+        self._buffer.append((generator_id, recorded_at, *values))
+        if len(self._buffer) >= self.batch_size:
+            self._full.set()
+
+    def add_many(self, generator_ids: Sequence[int], recorded_at: datetime, rows: Sequence[Sequence[float]]) -> None:
+        for generator_id, values in zip(generator_ids, rows):
+            self.add(generator_id, recorded_at, values)
+
+    def pending(self) -> int:
+        """Samples buffered and not yet handed to a flush."""
+        return len(self._buffer)
+
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            if not self._buffer:
+                return 0
+            batch, self._buffer = self._buffer, []
+            try:
+                async with self.engine.connect() as conn:
+                    for day in {row[1].astimezone(timezone.utc).date() for row in batch} - self._partitions:
+                        await create_partition(conn, day)
+                        self._partitions.add(day)
+                    await conn.commit()
+                    raw = await conn.get_raw_connection()
+                    await raw.driver_connection.copy_records_to_table(
+                        generator_telemetry.name, records=batch, columns=TELEMETRY_COLUMNS
+                    )
+            except Exception:
+                # put the batch back in front; add() keeps the total bounded
+                self._buffer[:0] = batch
+                raise
+            self.written += len(batch)
+            self.batches += 1
+            return len(batch)
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Telemetry flush failed: {e}")
+
+    def stats(self) -> dict:
+        return {"buffered": self.pending(), "written": self.written, "batches": self.batches, "dropped": self.dropped}
@@ -0,0 +1,76 @@
+import numpy as np
+
+from sqlalchemy import Float, Integer, bindparam, select, text
+from sqlalchemy.dialects.postgresql import ARRAY
+from db.models import GeneratorData, TELEMETRY_METRICS
+from db.notify import GENERATOR_SNAPSHOT_CHANNEL, SNAPSHOT_PUBLISHED_SETTING
+
+METRICS = TELEMETRY_METRICS
+
+# per metric: lower bound, upper bound, largest step down, largest step up, starting value
+LIMITS = {
+    "power_output": (2000.0, 3000.0, -50.0, 50.0, 2500.0),
+    "temperature": (70.0, 100.0, -2.0, 2.0, 85.3),
+    "pressure": (140.0, 160.0, -3.0, 3.0, 150.2),
+    "voltage": (13000.0, 14000.0, -100.0, 100.0, 13800.0),
+    "frequency": (49.5, 50.5, -0.2, 0.2, 50.0),
+    "fuel_level": (50.0, 100.0, -0.5, 0.1, 78.5),
+    "coolant_flow": (400.0, 500.0, -10.0, 10.0, 450.0),
+    "turbine_rpm": (2900.0, 3100.0, -20.0, 20.0, 3000.0),
+    "efficiency": (90.0, 98.0, -0.5, 0.5, 94.2),
+    "vibration_level": (1.5, 3.0, -0.2, 0.2, 2.1),
+}
+LOWER, UPPER, STEP_DOWN, STEP_UP, INITIAL = (np.array(column) for column in zip(*(LIMITS[metric] for metric in METRICS)))
+
+# The whole tick in one statement, run outside an explicit transaction: steps for every
+# generator arrive as arrays, the database clips and applies them, returns the new rows and
+# publishes the first :notify_limit of them, so listeners need not query them back.
+TICK_STATEMENT = text(
+    f"""
+    WITH published AS (
+        SELECT set_config('{SNAPSHOT_PUBLISHED_SETTING}', 'on', true)
+    ), updated AS (
+        UPDATE generator_data AS g SET
+            {", ".join(
+                f"{metric} = LEAST({LIMITS[metric][1]}, GREATEST({LIMITS[metric][0]}, g.{metric} + d.{metric}))"
+                for metric in METRICS
+            )},
+            updated_at = now()
+        FROM unnest(:ids, {", ".join(f":{metric}" for metric in METRICS)}) AS d(id, {", ".join(METRICS)})
+        WHERE g.id = d.id
+        RETURNING g.*
+    ), notified AS (
+        SELECT pg_notify('{GENERATOR_SNAPSHOT_CHANNEL}', row_to_json(updated)::text)
+        FROM updated WHERE updated.id <= :notify_limit
+    )
+    SELECT updated.id, {", ".join(f"updated.{metric}" for metric in METRICS)},
+        (SELECT count(*) FROM published) + (SELECT count(*) FROM notified) AS side_effects
+    FROM updated ORDER BY updated.id
+    """
+).bindparams(bindparam("ids", type_=ARRAY(Integer)), *(bindparam(metric, type_=ARRAY(Float)) for metric in METRICS))
+
+SEED_STATEMENT = text(
+    f"INSERT INTO generator_data (id, {', '.join(METRICS)}) "
+    f"SELECT id, {', '.join(f':{metric}' for metric in METRICS)} FROM generate_series(1, :count) AS id "
+    "ON CONFLICT (id) DO NOTHING"
+)
+
+class GeneratorSimulation:
+    """Draws the random-walk steps of all simulated generators at once, one row per generator and one column per metric."""
+
+    def __init__(self, ids, seed=None):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.rng = np.random.default_rng(seed)
+        self._id_list = self.ids.tolist()
+
+    def step(self) -> dict:
+        steps = self.rng.uniform(STEP_DOWN, STEP_UP, size=(len(self.ids), len(METRICS)))
+        return {"ids": self._id_list, **{metric: steps[:, index].tolist() for index, metric in enumerate(METRICS)}}
+
+async def load_simulation(conn, count: int, seed=None) -> GeneratorSimulation:
+    """Seeds generators 1..count that do not exist yet; their stored values are where the walk continues."""
+    await conn.execute(SEED_STATEMENT, {"count": count, **dict(zip(METRICS, INITIAL.tolist()))})
+    result = await conn.execute(
+        select(GeneratorData.id).where(GeneratorData.id.between(1, count)).order_by(GeneratorData.id)
+    )
+    return GeneratorSimulation(result.scalars().all(), seed=seed)
@@ -1,49 +1,82 @@
 import asyncio
-import random
+import os
 import logging
-from datetime import datetime
+import time
+from datetime import datetime, timezone
 
-from sqlalchemy import select
-from db.models import GeneratorData
+from db.models import GeneratorData, generator_telemetry
 from db.database import create_db_engine, create_session_maker
+from db.telemetry import TelemetryWriter, ensure_partitions, drop_expired_partitions
+from simulation import GeneratorSimulation, TICK_STATEMENT, load_simulation
+
+GENERATOR_COUNT = int(os.getenv("GENERATOR_COUNT", "4"))
+UPDATE_INTERVAL = float(os.getenv("UPDATE_INTERVAL", "10"))
+# generators whose new row is published with the tick; should cover every generator a bot watches
+UPDATE_NOTIFY_LIMIT = int(os.getenv("UPDATE_NOTIFY_LIMIT", "100"))
+TELEMETRY_BATCH_SIZE = int(os.getenv("TELEMETRY_BATCH_SIZE", "500"))
+TELEMETRY_FLUSH_INTERVAL = float(os.getenv("TELEMETRY_FLUSH_INTERVAL", "60"))
+TELEMETRY_RETENTION_DAYS = int(os.getenv("TELEMETRY_RETENTION_DAYS", "30"))
+TELEMETRY_MAINTENANCE_INTERVAL = float(os.getenv("TELEMETRY_MAINTENANCE_INTERVAL", "3600"))
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 engine = create_db_engine()
 async_session_maker = create_session_maker(engine)
+# the tick is a single statement, so it needs no BEGIN/COMMIT round trips around it
+autocommit_engine = engine.execution_options(isolation_level="AUTOCOMMIT")
+telemetry_writer = TelemetryWriter(engine, batch_size=TELEMETRY_BATCH_SIZE, flush_interval=TELEMETRY_FLUSH_INTERVAL)
 
-async def update_generator_data():
+async def update_generator_data(simulation: GeneratorSimulation):
+    loop = asyncio.get_running_loop()
+    next_tick = loop.time()
     while True:
         try:
-            async with async_session_maker() as session:
-                result = await session.execute(select(GeneratorData).limit(1))
-                gen_data = result.scalar_one_or_none()
-                
-                if gen_data:
-                    gen_data.power_output = max(2000, min(3000, gen_data.power_output + random.uniform(-50, 50)))
-                    gen_data.temperature = max(70, min(100, gen_data.temperature + random.uniform(-2, 2)))
-                    gen_data.pressure = max(140, min(160, gen_data.pressure + random.uniform(-3, 3)))
-                    gen_data.voltage = max(13000, min(14000, gen_data.voltage + random.uniform(-100, 100)))
-                    gen_data.frequency = max(49.5, min(50.5, gen_data.frequency + random.uniform(-0.2, 0.2)))
-                    gen_data.fuel_level = max(50, min(100, gen_data.fuel_level + random.uniform(-0.5, 0.1)))
-                    gen_data.coolant_flow = max(400, min(500, gen_data.coolant_flow + random.uniform(-10, 10)))
-                    gen_data.turbine_rpm = max(2900, min(3100, gen_data.turbine_rpm + random.uniform(-20, 20)))
-                    gen_data.efficiency = max(90, min(98, gen_data.efficiency + random.uniform(-0.5, 0.5)))
-                    gen_data.vibration_level = max(1.5, min(3.0, gen_data.vibration_level + random.uniform(-0.2, 0.2)))
-                    
-                    await session.commit()
-                    logger.info(f"Updated generator data at {datetime.now()}")
-                
+            started = time.perf_counter()
+            async with autocommit_engine.connect() as conn:
+                result = await conn.execute(TICK_STATEMENT, {**simulation.step(), "notify_limit": UPDATE_NOTIFY_LIMIT})
+                rows = result.all()
+            telemetry_writer.add_many([row[0] for row in rows], datetime.now(timezone.utc), [row[1:-1] for row in rows])
+            logger.info(f"Updated {len(simulation.ids)} generators in {(time.perf_counter() - started) * 1000:.1f}ms")
         except Exception as e:
             logger.error(f"Error updating data: {e}")
-        
-        await asyncio.sleep(10)
+
+        # ticks stay on a fixed grid; a tick that overruns skips the slots it missed
+        next_tick += UPDATE_INTERVAL
+        now = loop.time()
+        if now > next_tick:
+            missed = int((now - next_tick) // UPDATE_INTERVAL) + 1
+            logger.warning(f"Update tick overran, skipping {missed} tick(s)")
+            next_tick += missed * UPDATE_INTERVAL
+        await asyncio.sleep(next_tick - now)
+
+async def maintain_telemetry():
+    while True:
+        try:
+            async with engine.begin() as conn:
+                await ensure_partitions(conn)
+                dropped = await drop_expired_partitions(conn, TELEMETRY_RETENTION_DAYS)
+            if dropped:
+                logger.info(f"Dropped expired telemetry partitions: {', '.join(dropped)}")
+        except Exception as e:
+            logger.error(f"Telemetry maintenance failed: {e}")
+
+        await asyncio.sleep(TELEMETRY_MAINTENANCE_INTERVAL)
 
 async def main():
     logger.info("Starting updater service...")
     await asyncio.sleep(5)
-    await update_generator_data()
+    async with engine.begin() as conn:
+        await conn.run_sync(GeneratorData.__table__.create, checkfirst=True)
+        await conn.run_sync(generator_telemetry.create, checkfirst=True)
+        simulation = await load_simulation(conn, GENERATOR_COUNT)
+    logger.info(f"Simulating {len(simulation.ids)} generators every {UPDATE_INTERVAL}s")
+    await telemetry_writer.start()
+    asyncio.create_task(maintain_telemetry())
+    try:
+        await update_generator_data(simulation)
+    finally:
+        await telemetry_writer.stop()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file